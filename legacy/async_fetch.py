@@ -0,0 +1,63 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import http_client
+
+
+# Politeness limits, applied to each host separately
+MAX_CONCURRENT_PER_HOST = 2
+REQUESTS_PER_SECOND_PER_HOST = 2
+BURST_PER_HOST = 4
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _fetch_all(urls, on_response, get):
+    loop = asyncio.get_event_loop()
+    semaphores = {}
+    buckets = {}
+
+    async def fetch(url):
+        host = urlparse(url).netloc
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(MAX_CONCURRENT_PER_HOST)
+            buckets[host] = TokenBucket(REQUESTS_PER_SECOND_PER_HOST, BURST_PER_HOST)
+        async with semaphores[host]:
+            await buckets[host].acquire()
+            resp = await loop.run_in_executor(None, get, url)
+        # Handled outside the host's semaphore, so the next page can download while this one's parsed
+        return await loop.run_in_executor(None, on_response, url, resp)
+
+    return await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+
+
+def fetch_all(urls, on_response, get=http_client.get):
+    """
+    Fetch every url concurrently with get(url), within the per-host limits above, calling on_response(url, response)
+    on a worker thread as soon as each response arrives. Returns the results of on_response in the order of urls. If
+    any fetch or callback raised, the first exception is re-raised once the rest have finished.
+    """
+    results = asyncio.run(_fetch_all(urls, on_response, get))
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
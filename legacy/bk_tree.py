@@ -0,0 +1,39 @@
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """A BK-tree over integer hashes, for finding every stored hash within a Hamming distance of a query"""
+
+    def __init__(self):
+        # Each node is [hash, value, {distance: child node}]
+        self.root = None
+
+    def add(self, hash_, value):
+        node = [hash_, value, {}]
+        if self.root is None:
+            self.root = node
+            return
+        parent = self.root
+        while True:
+            distance = hamming_distance(hash_, parent[0])
+            child = parent[2].get(distance)
+            if child is None:
+                parent[2][distance] = node
+                return
+            parent = child
+
+    def find(self, hash_, max_distance):
+        """Return (distance, value) for every stored hash within max_distance, closest first"""
+        matches = []
+        candidates = [self.root] if self.root is not None else []
+        while candidates:
+            node_hash, value, children = candidates.pop()
+            distance = hamming_distance(hash_, node_hash)
+            if distance <= max_distance:
+                matches.append((distance, value))
+            # By the triangle inequality, only children this far from the node can be close enough
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+        return sorted(matches, key=lambda match: match[0])
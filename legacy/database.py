@@ -1,105 +1,274 @@
+import contextlib
 import datetime
 import os
 import json
-from urllib.parse import urlparse
-from PIL import Image
-import requests
+import threading
 
+from bk_tree import BKTree
+from dog_record import DogRecord
+from image_utils import REPOST_MAX_DISTANCE, fetch_image, get_content_hash, get_image_filepath, save_image
+
+
+# 'json' keeps every record in memory, backed by DB_PATH and JOURNAL_PATH. 'sqlite' queries rows on demand
+# (see database_sqlite.py), migrating DB_PATH across the first time it is used.
+BACKEND = os.environ.get('WATCHDOG_DB_BACKEND', 'json')
 
 DB_PATH = os.path.join('images', 'database.json')
+# Mutations are appended here, one compact line per write, and periodically folded back into DB_PATH
+JOURNAL_PATH = os.path.join('images', 'database.journal')
+USE_JOURNAL = True
+COMPACT_AFTER = 1000
 
+# url -> DogRecord
 dog_db = {}
+# Lookups from img_url and image content hash to the (first) listing url, so duplicate checks don't scan every record
+img_url_index = {}
+content_index = {}
+# Urls still waiting to be classified / notified, as insertion-ordered dicts (values unused) so the oldest come first
+unclassified_queue = {}
+unnotified_queue = {}
+# Perceptual hashes of every original (non-repost) image, for spotting the same dog posted under another url
+repost_tree = BKTree()
+journal_length = 0
+# While a transaction is open: the pre-transaction copy of each touched record (None if it was added), and
+# the changes waiting to be persisted when it commits
+_undo = None
+_pending = None
+# Held while reading or changing the database from a thread that might be racing others
+lock = threading.RLock()
+
+
+def _index_record(url, record):
+    """Bring the lookups and work queues up to date with a new or changed record"""
+    img_url_index[record['img_url']] = url
+    if record['content_hash'] is not None:
+        content_index.setdefault(record['content_hash'], url)
+    if record['desired'] is None:
+        unclassified_queue[url] = None
+    else:
+        unclassified_queue.pop(url, None)
+    if not record['notified']:
+        unnotified_queue[url] = None
+    else:
+        unnotified_queue.pop(url, None)
+
+
+def _unindex_record(url, record):
+    img_url_index.pop(record['img_url'], None)
+    if content_index.get(record['content_hash']) == url:
+        del content_index[record['content_hash']]
+    unclassified_queue.pop(url, None)
+    unnotified_queue.pop(url, None)
+
+
+def _rebuild_indexes():
+    global repost_tree
+    img_url_index.clear()
+    content_index.clear()
+    unclassified_queue.clear()
+    unnotified_queue.clear()
+    repost_tree = BKTree()
+    for url, record in dog_db.items():
+        _index_record(url, record)
+        if record['phash'] is not None and record['duplicate_of'] is None:
+            repost_tree.add(record['phash'], url)
+
+
+def _replay_journal():
+    global journal_length
+    journal_length = 0
+    if not os.path.exists(JOURNAL_PATH):
+        return
+    with open(JOURNAL_PATH, 'rb+') as f:
+        # Bytes of whole, readable lines so far
+        intact = 0
+        for line in f:
+            # Each line is a batch of [url, changes] pairs, so a transaction is applied all or nothing
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('unterminated line')
+                batch = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write - everything before it is intact. Cut it off, or the next
+                # write would be appended onto it and be unreadable too.
+                print(f'Dropping a partly written last line of {JOURNAL_PATH}')
+                f.truncate(intact)
+                break
+            for url, changes in batch:
+                if url in dog_db:
+                    dog_db[url].update(changes)
+                else:
+                    dog_db[url] = DogRecord.from_dict(changes)
+            journal_length += len(batch)
+            intact += len(line)
 
 
 def load_db():
     global dog_db
-    if os.path.exists(DB_PATH):
-        with open(DB_PATH, 'r') as f:
-            dog_db = json.load(f)
+    with lock:
+        # Start from scratch, so reloading doesn't replay the journal over records already in memory
+        dog_db = {}
+        if os.path.exists(DB_PATH):
+            with open(DB_PATH, 'r') as f:
+                dog_db = {url: DogRecord.from_dict(record) for url, record in json.load(f).items()}
+        _replay_journal()
+        _rebuild_indexes()
 
 
 def save_db():
-    with open(DB_PATH, 'w') as f:
-        json.dump(dog_db, f, indent=2, default=str)
-
-
-load_db()
-
-
-def already_scraped(url, img_url, img_path):
-    url_exists = url in dog_db
-    img_url_exists = len([v for v in dog_db.values() if v['img_url'] == img_url]) > 0
-    img_already_downloaded = len([v for v in dog_db.values() if v['img'] == img_path]) > 0
-    return url_exists or img_url_exists or img_already_downloaded
-
-
-def _fetch_image(url):
-    return Image.open(requests.get(url, stream=True).raw).convert('RGB')
-
-
-def _save_image(url, filepath):
-    """Save an image, return True if it's big enough to be a legit dog image"""
-    img_data = _fetch_image(url)
-    img_data.save(filepath)
-    return img_data.size[0] >= 100 and img_data.size[1] >= 100
-
-
-def make_unique_filename(name):
-    now = str(datetime.datetime.now())
-    now = now[:now.rindex('.')]
-    now = now.replace(':', '-').replace(' ', '_')
-    base, ext = os.path.splitext(name)
-    return f'{base}_{now}{ext}'
-
+    """Write a full snapshot of the database, folding in (and clearing) the journal"""
+    global journal_length
+    tmp_path = DB_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({url: record.to_dict() for url, record in dog_db.items()}, f, indent=2, default=str)
+    os.replace(tmp_path, DB_PATH)
+    if os.path.exists(JOURNAL_PATH):
+        os.remove(JOURNAL_PATH)
+    journal_length = 0
+
+
+def _write_changes(batch):
+    """Persist a batch of [url, changes] pairs, costing O(changes) rather than O(database) when journaling"""
+    global journal_length
+    if not USE_JOURNAL:
+        save_db()
+        return
+    line = json.dumps(batch, separators=(',', ':'), default=str) + '\n'
+    with open(JOURNAL_PATH, 'a') as f:
+        start = f.tell()
+        try:
+            f.write(line)
+            f.flush()
+        except BaseException:
+            # Don't leave a partial line for later batches to be appended onto
+            f.truncate(start)
+            raise
+    journal_length += len(batch)
+    if journal_length >= COMPACT_AFTER:
+        save_db()
 
-def get_image_filepath(url):
-    if not url.startswith('http'):
-        parsed_url = urlparse(url)
-        url = f'{parsed_url.scheme}://{parsed_url.netloc}{url}'
-    filename = os.path.basename(url)
-    if '?' in filename:
-        filename = filename[:filename.index('?')]
-    if os.path.splitext(filename)[1].lower().endswith('php'):
-        filename = os.path.splitext(filename)[0] + '.jpg'
-    if not os.path.splitext(filename)[1]:
-        filename = filename + '.jpg'
-    # Facebook external link thumbnails all have the same filename - make them unique in this case
-    if filename == 'safe_image.jpg':
-        filename = make_unique_filename(filename)
 
-    return os.path.join('.', 'images', 'fetched', filename)
+def _before_change(url):
+    if _undo is not None and url not in _undo:
+        _undo[url] = dog_db[url].copy() if url in dog_db else None
+
+
+def _persist(url, changes):
+    if _pending is not None:
+        _pending.append([url, changes])
+    else:
+        _write_changes([[url, changes]])
+
+
+@contextlib.contextmanager
+def transaction():
+    """Defer persisting changes until the block exits, undoing them in memory if it raises"""
+    global _undo, _pending
+    # Other threads wait until the transaction is over, so their changes don't get mixed into it
+    with lock:
+        if _undo is not None:
+            # Nested - the outermost transaction commits
+            yield
+            return
+        _undo, _pending = {}, []
+        try:
+            yield
+            if _pending:
+                _write_changes(_pending)
+        except BaseException:
+            for url, record in _undo.items():
+                if url in dog_db:
+                    _unindex_record(url, dog_db[url])
+                if record is None:
+                    dog_db.pop(url, None)
+                else:
+                    dog_db[url] = record
+                    _index_record(url, record)
+            raise
+        finally:
+            _undo = _pending = None
+
+
+def already_scraped(url, img_url):
+    return url in dog_db or img_url in img_url_index
+
+
+def find_repost(phash):
+    """Return the url of an existing listing with a near-identical image, if there is one"""
+    for distance, url in repost_tree.find(phash, REPOST_MAX_DISTANCE):
+        # The tree can't drop entries, so skip any left behind by a rolled back transaction
+        if url in dog_db:
+            return url
+    return None
 
 
 def add(url, img_url):
-    img_path = get_image_filepath(img_url)
-    if not already_scraped(url, img_url, img_path):
-        legit_dog = _save_image(img_url, img_path)
-
-        dog_db[url] = dict(img=img_path,
-                           desired=None if legit_dog else False,
-                           notified=False if legit_dog else True,
-                           scrape_datetime=datetime.datetime.now(),
-                           predicted_classes=None if legit_dog else [],
-                           img_url=img_url)
-        save_db()
+    """Store a listing if it hasn't been seen before, returning True if it was added"""
+    if already_scraped(url, img_url):
+        return False
+    data, img_format = fetch_image(img_url)
+    # Scrapers run concurrently, so the rest happens under the lock - including making sure another thread didn't
+    # add the listing while the image was downloading
+    with lock:
+        if already_scraped(url, img_url):
+            return False
+        # Images too small to be dogs aren't downloaded in full or stored, so they keep an empty img path
+        img_path, content_hash, phash, duplicate_of = '', None, None, None
+        if data is not None:
+            content_hash = get_content_hash(data)
+            if content_hash in content_index:
+                # Byte-for-byte the same image as an existing listing - link to it without decoding anything
+                original_url = content_index[content_hash]
+                img_path = dog_db[original_url]['img']
+                duplicate_of = dog_db[original_url]['duplicate_of'] or original_url
+            else:
+                img_path = get_image_filepath(content_hash, img_format)
+                phash = save_image(data, img_path)
+                duplicate_of = find_repost(phash)
+        # Reposts are linked to the original listing, which has (or will be) classified and notified on its own
+        pending = phash is not None and duplicate_of is None
+
+        _before_change(url)
+        dog_db[url] = DogRecord(img=img_path,
+                                desired=None if pending else False,
+                                notified=False if pending else True,
+                                scrape_datetime=datetime.datetime.now(),
+                                predicted_classes=None if pending else [],
+                                img_url=img_url,
+                                phash=phash,
+                                duplicate_of=duplicate_of,
+                                content_hash=content_hash)
+        _index_record(url, dog_db[url])
+        if pending:
+            repost_tree.add(phash, url)
+        _persist(url, dog_db[url].to_dict())
+    return True
 
 
 def set_desired(url, desired, pred_classes):
-    # Set their desired property
-    dog_db[url]['desired'] = desired
-    dog_db[url]['predicted_classes'] = pred_classes
-    # If they're not desired, pretend we already notified
-    dog_db[url]['notified'] = not desired
-    save_db()
+    with lock:
+        _before_change(url)
+        # Set their desired property
+        dog_db[url]['desired'] = desired
+        dog_db[url]['predicted_classes'] = pred_classes
+        # If they're not desired, pretend we already notified
+        dog_db[url]['notified'] = not desired
+        _index_record(url, dog_db[url])
+        _persist(url, dict(desired=desired, predicted_classes=pred_classes, notified=not desired))
 
 
 def set_notified(url):
-    dog_db[url]['notified'] = True
-    save_db()
+    with lock:
+        _before_change(url)
+        dog_db[url]['notified'] = True
+        _index_record(url, dog_db[url])
+        _persist(url, dict(notified=True))
 
 
 def reload_database():
-    load_db()
+    # Mid-transaction, memory is ahead of the files on disk
+    if _undo is None:
+        load_db()
 
 
 def get_records():
@@ -107,12 +276,31 @@ def get_records():
 
 
 def get_unclassified():
-    return {k: v for k, v in dog_db.items() if v['desired'] is None}
+    return {url: dog_db[url] for url in unclassified_queue}
 
 
 def get_unnotified():
-    return {k: v for k, v in dog_db.items() if not v['notified']}
+    return {url: dog_db[url] for url in unnotified_queue}
 
 
 def count():
     return len(dog_db)
+
+
+def _migrate_to_sqlite():
+    """One-shot copy of the JSON database into an empty SQLite database"""
+    import database_sqlite
+    database_sqlite.connect()
+    if database_sqlite.count() == 0 and (os.path.exists(DB_PATH) or os.path.exists(JOURNAL_PATH)):
+        load_db()
+        print(f'Migrating {len(dog_db)} records from {DB_PATH} to {database_sqlite.SQLITE_PATH}')
+        database_sqlite.insert_records(dog_db)
+        dog_db.clear()
+        _rebuild_indexes()
+
+
+if BACKEND == 'sqlite':
+    _migrate_to_sqlite()
+    from database_sqlite import *
+else:
+    load_db()
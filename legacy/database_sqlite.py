@@ -0,0 +1,230 @@
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from bk_tree import BKTree
+from image_utils import REPOST_MAX_DISTANCE, fetch_image, get_content_hash, get_image_filepath, save_image
+
+
+SQLITE_PATH = os.path.join('images', 'database.sqlite')
+
+# Only the shared database API is re-exported by database.py when BACKEND == 'sqlite'
+__all__ = ['already_scraped', 'add', 'set_desired', 'set_notified', 'transaction', 'reload_database',
+           'get_records', 'get_unclassified', 'get_unnotified', 'count']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dogs (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    img TEXT NOT NULL,
+    img_url TEXT NOT NULL,
+    desired INTEGER,
+    notified INTEGER NOT NULL,
+    scrape_datetime TEXT NOT NULL,
+    predicted_classes TEXT,
+    phash TEXT,
+    duplicate_of TEXT,
+    content_hash TEXT
+);
+'''
+# Columns added since the table was first created, which older databases gain on connect
+ADDED_COLUMNS = {'phash': 'TEXT', 'duplicate_of': 'TEXT', 'content_hash': 'TEXT'}
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS dogs_img_url ON dogs (img_url);
+CREATE INDEX IF NOT EXISTS dogs_img ON dogs (img);
+CREATE INDEX IF NOT EXISTS dogs_desired ON dogs (desired);
+CREATE INDEX IF NOT EXISTS dogs_notified ON dogs (notified);
+CREATE INDEX IF NOT EXISTS dogs_content_hash ON dogs (content_hash);
+'''
+# The UNIQUE constraint on url already gives it an index
+COLUMNS = 'url, img, img_url, desired, notified, scrape_datetime, predicted_classes, phash, duplicate_of, content_hash'
+PLACEHOLDERS = ', '.join('?' for _ in COLUMNS.split(', '))
+
+# The web app reads from its own thread, and sqlite3 connections can't be shared between threads
+_local = threading.local()
+# Perceptual hashes of every original (non-repost) image, built from the database on first use
+_repost_tree = None
+# Serialises adds, which check then insert and update _repost_tree
+_lock = threading.RLock()
+
+
+def connect():
+    if getattr(_local, 'conn', None) is None:
+        # Writers from other threads wait on each other's transactions rather than failing straight away
+        conn = sqlite3.connect(SQLITE_PATH, timeout=60)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        existing_columns = {row[1] for row in conn.execute('PRAGMA table_info(dogs)')}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing_columns:
+                conn.execute(f'ALTER TABLE dogs ADD COLUMN {column} {column_type}')
+        conn.executescript(INDEXES)
+        _local.conn = conn
+    return _local.conn
+
+
+def _to_row(url, record):
+    desired = record['desired']
+    predicted_classes = record['predicted_classes']
+    phash = record.get('phash')
+    return (url,
+            record['img'],
+            record['img_url'],
+            None if desired is None else int(desired),
+            int(record['notified']),
+            str(record['scrape_datetime']),
+            None if predicted_classes is None else json.dumps(predicted_classes),
+            # Stored as hex, as a 64 bit hash can overflow SQLite's signed integers
+            None if phash is None else format(phash, '016x'),
+            record.get('duplicate_of'),
+            record.get('content_hash'))
+
+
+def _from_row(row):
+    url, img, img_url, desired, notified, scrape_datetime, predicted_classes, phash, duplicate_of, content_hash = row
+    return url, dict(img=img,
+                     desired=None if desired is None else bool(desired),
+                     notified=bool(notified),
+                     scrape_datetime=scrape_datetime,
+                     predicted_classes=None if predicted_classes is None else json.loads(predicted_classes),
+                     img_url=img_url,
+                     phash=None if phash is None else int(phash, 16),
+                     duplicate_of=duplicate_of,
+                     content_hash=content_hash)
+
+
+def _write(sql, params, many=False):
+    conn = connect()
+    execute = conn.executemany if many else conn.execute
+    if getattr(_local, 'in_transaction', False):
+        execute(sql, params)
+    else:
+        with conn:
+            execute(sql, params)
+
+
+@contextlib.contextmanager
+def transaction():
+    """Commit every change made in the block at once, or none of them if it raises"""
+    conn = connect()
+    if getattr(_local, 'in_transaction', False):
+        # Nested - the outermost transaction commits
+        yield
+        return
+    _local.in_transaction = True
+    try:
+        with conn:
+            yield
+    finally:
+        _local.in_transaction = False
+
+
+def _query(where='', params=()):
+    rows = connect().execute(f'SELECT {COLUMNS} FROM dogs {where} ORDER BY id', params)
+    return dict(_from_row(row) for row in rows)
+
+
+def insert_records(records):
+    _write(f'INSERT OR IGNORE INTO dogs ({COLUMNS}) VALUES ({PLACEHOLDERS})',
+           [_to_row(url, record) for url, record in records.items()], many=True)
+
+
+def already_scraped(url, img_url):
+    row = connect().execute('SELECT 1 FROM dogs WHERE url = ? OR img_url = ? LIMIT 1', (url, img_url)).fetchone()
+    return row is not None
+
+
+def _get_repost_tree():
+    global _repost_tree
+    if _repost_tree is None:
+        _repost_tree = BKTree()
+        for url, phash in connect().execute(
+                'SELECT url, phash FROM dogs WHERE phash IS NOT NULL AND duplicate_of IS NULL'):
+            _repost_tree.add(int(phash, 16), url)
+    return _repost_tree
+
+
+def find_repost(phash):
+    """Return the url of an existing listing with a near-identical image, if there is one"""
+    for distance, url in _get_repost_tree().find(phash, REPOST_MAX_DISTANCE):
+        # The tree can't drop entries, so skip any left behind by a rolled back transaction
+        if connect().execute('SELECT 1 FROM dogs WHERE url = ?', (url, )).fetchone():
+            return url
+    return None
+
+
+def add(url, img_url):
+    """Store a listing if it hasn't been seen before, returning True if it was added"""
+    if already_scraped(url, img_url):
+        return False
+    data, img_format = fetch_image(img_url)
+    # Scrapers run concurrently, so the rest happens under the lock - including making sure another thread didn't
+    # add the listing while the image was downloading
+    with _lock:
+        if already_scraped(url, img_url):
+            return False
+        # Images too small to be dogs aren't downloaded in full or stored, so they keep an empty img path
+        img_path, content_hash, phash, duplicate_of = '', None, None, None
+        if data is not None:
+            content_hash = get_content_hash(data)
+            original = connect().execute(
+                'SELECT url, img, duplicate_of FROM dogs WHERE content_hash = ? ORDER BY id LIMIT 1',
+                (content_hash, )).fetchone()
+            if original is not None:
+                # Byte-for-byte the same image as an existing listing - link to it without decoding anything
+                original_url, img_path, original_duplicate_of = original
+                duplicate_of = original_duplicate_of or original_url
+            else:
+                img_path = get_image_filepath(content_hash, img_format)
+                phash = save_image(data, img_path)
+                duplicate_of = find_repost(phash)
+        # Reposts are linked to the original listing, which has (or will be) classified and notified on its own
+        pending = phash is not None and duplicate_of is None
+
+        insert_records({url: dict(img=img_path,
+                                  desired=None if pending else False,
+                                  notified=False if pending else True,
+                                  scrape_datetime=datetime.datetime.now(),
+                                  predicted_classes=None if pending else [],
+                                  img_url=img_url,
+                                  phash=phash,
+                                  duplicate_of=duplicate_of,
+                                  content_hash=content_hash)})
+        if pending:
+            _get_repost_tree().add(phash, url)
+    return True
+
+
+def set_desired(url, desired, pred_classes):
+    # If they're not desired, pretend we already notified
+    _write('UPDATE dogs SET desired = ?, predicted_classes = ?, notified = ? WHERE url = ?',
+           (int(desired), json.dumps(pred_classes), int(not desired), url))
+
+
+def set_notified(url):
+    _write('UPDATE dogs SET notified = 1 WHERE url = ?', (url, ))
+
+
+def reload_database():
+    # Every read goes to the database file, so there's nothing cached to refresh
+    pass
+
+
+def get_records():
+    return _query()
+
+
+# Both served from the desired/notified indexes, oldest first, without touching the rest of the table
+def get_unclassified():
+    return _query('WHERE desired IS NULL')
+
+
+def get_unnotified():
+    return _query('WHERE notified = 0')
+
+
+def count():
+    return connect().execute('SELECT COUNT(*) FROM dogs').fetchone()[0]
@@ -0,0 +1,119 @@
+import datetime
+import sys
+
+
+DESIRED_KNOWN = 1
+DESIRED = 2
+NOTIFIED = 4
+
+
+def _intern_all(strings):
+    return None if strings is None else tuple(sys.intern(s) for s in strings)
+
+
+class DogRecord:
+    """
+    A compact stand-in for the record dicts in database.dog_db. desired/notified are packed into a bitfield, the
+    scrape time is held as integer epoch seconds and predicted breeds are interned, but the record can still be read
+    and written like the dict it replaces, e.g. record['desired'].
+    """
+    __slots__ = ('img', 'img_url', 'flags', 'timestamp', 'predicted_classes', 'phash', 'duplicate_of', 'content_hash')
+
+    KEYS = ('img', 'desired', 'notified', 'scrape_datetime', 'predicted_classes', 'img_url', 'phash', 'duplicate_of',
+            'content_hash')
+    PLAIN_KEYS = ('img', 'img_url', 'phash', 'duplicate_of', 'content_hash')
+
+    def __init__(self, img, desired, notified, scrape_datetime, predicted_classes, img_url, phash=None,
+                 duplicate_of=None, content_hash=None):
+        self.img = img
+        self.img_url = img_url
+        self.phash = phash
+        self.duplicate_of = duplicate_of
+        self.content_hash = content_hash
+        self.flags = 0
+        self.timestamp = 0
+        self.predicted_classes = None
+        self['desired'] = desired
+        self['notified'] = notified
+        self['scrape_datetime'] = scrape_datetime
+        self['predicted_classes'] = predicted_classes
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(**{key: record.get(key) for key in cls.KEYS})
+
+    def __getitem__(self, key):
+        if key == 'desired':
+            return bool(self.flags & DESIRED) if self.flags & DESIRED_KNOWN else None
+        if key == 'notified':
+            return bool(self.flags & NOTIFIED)
+        if key == 'scrape_datetime':
+            return str(datetime.datetime.fromtimestamp(self.timestamp))
+        if key == 'predicted_classes':
+            return None if self.predicted_classes is None else list(self.predicted_classes)
+        if key in self.PLAIN_KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'desired':
+            self.flags &= ~(DESIRED_KNOWN | DESIRED)
+            if value is not None:
+                self.flags |= DESIRED_KNOWN | (DESIRED if value else 0)
+        elif key == 'notified':
+            self.flags = self.flags | NOTIFIED if value else self.flags & ~NOTIFIED
+        elif key == 'scrape_datetime':
+            if isinstance(value, str):
+                value = datetime.datetime.fromisoformat(value)
+            self.timestamp = int(value.timestamp()) if value is not None else 0
+        elif key == 'predicted_classes':
+            self.predicted_classes = _intern_all(value)
+        elif key in self.PLAIN_KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def get(self, key, default=None):
+        return self[key] if key in self.KEYS else default
+
+    def update(self, changes):
+        for key, value in changes.items():
+            self[key] = value
+
+    def copy(self):
+        return DogRecord.from_dict(self.to_dict())
+
+    def to_dict(self):
+        return {key: self[key] for key in self.KEYS}
+
+    def __repr__(self):
+        return f'DogRecord({self.to_dict()})'
+
+
+if __name__ == '__main__':
+    # Compare the memory held by 100k records as plain dicts (as loaded from database.json) and as DogRecords
+    import random
+    import tracemalloc
+
+    breeds = ['pug', 'beagle', 'border_collie', 'cavalier_king_charles_spaniel', 'maltese', 'toy_poodle']
+
+    def fake_record(i):
+        return dict(img=f'./images/fetched/{i}_n.jpg',
+                    desired=random.choice([None, True, False]),
+                    notified=random.choice([True, False]),
+                    scrape_datetime=str(datetime.datetime.now() - datetime.timedelta(seconds=i)),
+                    predicted_classes=[''.join(list(random.choice(breeds))) for _ in range(2)],
+                    img_url=f'https://scontent.xx.fbcdn.net/v/t1.0-9/{i}_n.jpg?_nc_cat=1')
+
+    # Build each record from a fresh copy so strings aren't shared between the two measurements
+    for name, build in (('dict', lambda r: r), ('DogRecord', DogRecord.from_dict)):
+        random.seed(0)
+        tracemalloc.start()
+        db = {f'https://www.facebook.com/{i}': build(fake_record(i)) for i in range(100_000)}
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name}: {size / 2 ** 20:.1f} MiB for {len(db)} records')
+        del db
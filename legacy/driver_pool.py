@@ -0,0 +1,140 @@
+import contextlib
+import os
+import threading
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and all of its descendants, via /proc. None where that isn't available."""
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    rss_kb = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue
+        children.setdefault(int(status['PPid']), []).append(int(entry))
+        rss_kb[int(entry)] = int(status.get('VmRSS', '0 kB').split()[0])
+    total_kb = 0
+    to_visit = [pid]
+    while to_visit:
+        current = to_visit.pop()
+        total_kb += rss_kb.get(current, 0)
+        to_visit.extend(children.get(current, []))
+    return total_kb / 1024
+
+
+class DriverPool:
+    """
+    Keeps browsers warm between check cycles, so Chrome start-up (and anything the browser remembers, like a Facebook
+    session) isn't paid for every cycle. Browsers are lent out with borrow(), checked before each loan, and replaced
+    once they've been lent max_uses times or their processes use more than max_rss_mb of memory.
+    """
+
+    def __init__(self, create_driver, size=2, max_uses=50, max_rss_mb=2000):
+        self.create_driver = create_driver
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.idle = []
+        # id(driver) -> times lent out, for every driver the pool owns (idle or borrowed)
+        self.uses = {}
+        # id(driver) -> driver, for those currently borrowed
+        self.lent = {}
+        # Number of browsers currently being started
+        self.starting = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def _is_healthy(self, driver):
+        try:
+            driver.current_url
+        except Exception:
+            return False
+        return True
+
+    def _over_memory_limit(self, driver):
+        try:
+            rss_mb = process_tree_rss_mb(driver.service.process.pid)
+        except AttributeError:
+            rss_mb = None
+        return rss_mb is not None and rss_mb > self.max_rss_mb
+
+    def _discard(self, driver):
+        self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _take(self, timeout):
+        with self.condition:
+            if not self.condition.wait_for(
+                    lambda: self.closed or self.idle or len(self.uses) + self.starting < self.size, timeout):
+                raise TimeoutError(f'No browser became free within {timeout} seconds')
+            if self.closed:
+                raise RuntimeError('The browser pool has been closed')
+            if self.idle:
+                driver = self.idle.pop()
+            else:
+                driver = None
+                self.starting += 1
+        if driver is not None and not self._is_healthy(driver):
+            print('Replacing an unresponsive browser.')
+            with self.condition:
+                # Its slot in the pool goes to the replacement
+                self._discard(driver)
+                self.starting += 1
+            driver = None
+        if driver is None:
+            try:
+                driver = self.create_driver()
+            finally:
+                with self.condition:
+                    self.starting -= 1
+                    if driver is not None:
+                        self.uses[id(driver)] = 0
+                    self.condition.notify()
+        with self.condition:
+            if self.closed:
+                # Closed while this was being checked or started
+                self._discard(driver)
+                raise RuntimeError('The browser pool has been closed')
+            self.lent[id(driver)] = driver
+        return driver
+
+    def _give_back(self, driver):
+        over_memory_limit = self._over_memory_limit(driver)
+        with self.condition:
+            self.lent.pop(id(driver), None)
+            # One given back after the pool was closed (e.g. by a lane that timed out) was quit by close
+            if not self.closed:
+                self.uses[id(driver)] += 1
+                if over_memory_limit or self.uses[id(driver)] >= self.max_uses:
+                    self._discard(driver)
+                else:
+                    self.idle.append(driver)
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def borrow(self, timeout=None):
+        """Lend out a driver, waiting up to `timeout` seconds (forever if None) for one to be free"""
+        driver = self._take(timeout)
+        try:
+            yield driver
+        finally:
+            self._give_back(driver)
+
+    def close(self):
+        """Quit every browser, including any still borrowed, which can't be lent out again"""
+        with self.condition:
+            self.closed = True
+            for driver in self.idle + list(self.lent.values()):
+                self._discard(driver)
+            self.idle = []
+            self.lent = {}
+            self.condition.notify_all()
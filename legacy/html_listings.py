@@ -0,0 +1,71 @@
+import os
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+
+# Elements that never have children, so are never left open
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source',
+                 'track', 'wbr'}
+
+
+class _LinkedImageParser(HTMLParser):
+    """
+    Streams through a page keeping only the stack of open tag names and the links among them, rather than building a
+    tree. Elements are opened and closed the way BeautifulSoup's html.parser builder does it - an end tag closes
+    everything opened since its element, and one with no open element is ignored.
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        parsed_url = urlparse(url)
+        self.origin = f'{parsed_url.scheme}://{parsed_url.netloc}'
+        self.open_tags = []
+        # (index in open_tags, href) of each open <a>, innermost last
+        self.open_links = []
+        self.listings = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'img':
+            self._handle_img(attrs)
+        if tag in VOID_ELEMENTS:
+            return
+        if tag == 'a':
+            self.open_links.append((len(self.open_tags), attrs.get('href')))
+        self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'img':
+            self._handle_img(dict(attrs))
+
+    def handle_endtag(self, tag):
+        if tag not in self.open_tags:
+            return
+        index = len(self.open_tags) - 1 - self.open_tags[::-1].index(tag)
+        del self.open_tags[index:]
+        while self.open_links and self.open_links[-1][0] >= index:
+            self.open_links.pop()
+
+    def _handle_img(self, attrs):
+        if 'src' not in attrs or not self.open_links:
+            return
+        href = self.open_links[-1][1]
+        for key in ['src', 'data-src']:
+            if key not in attrs:
+                continue
+            src = attrs[key] or ''
+            if not src.startswith('http'):
+                src = f'{self.origin}{src}'
+            filename = os.path.basename(src)
+            if '?' in filename:
+                filename = filename[:filename.index('?')]
+            if (filename.lower().endswith('jpg') or filename.lower().endswith('jpeg')) and href is not None:
+                self.listings.append((href, src))
+
+
+def linked_jpgs(url, html):
+    """(href, img_src) for every jpg image inside a link, in one pass over the page's html"""
+    parser = _LinkedImageParser(url)
+    parser.feed(html)
+    parser.close()
+    return parser.listings
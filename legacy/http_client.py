@@ -0,0 +1,29 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 30)
+# Number of hosts to keep a connection pool open for, and connections kept alive per host
+POOL_HOSTS = 20
+POOL_SIZE = 10
+
+# Sessions aren't guaranteed to be thread safe, so each thread gets its own
+_local = threading.local()
+
+
+def get_session():
+    """A keep-alive session reusing connections to each host across requests"""
+    if getattr(_local, 'session', None) is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return _local.session
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUT)
+    return get_session().get(url, **kwargs)
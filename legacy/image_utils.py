@@ -0,0 +1,71 @@
+import hashlib
+import io
+import os
+from PIL import Image, ImageFile, UnidentifiedImageError
+
+import http_client
+
+
+# Images whose perceptual hashes differ by at most this many of their 64 bits are treated as the same photo
+REPOST_MAX_DISTANCE = 5
+
+# Anything smaller than this in either dimension isn't a legit dog image
+MIN_DOG_SIZE = 100
+
+IMAGE_DIR = os.path.join('.', 'images', 'fetched')
+CHUNK_SIZE = 16 * 1024
+
+
+def fetch_image(url):
+    """
+    Download an image, returning its bytes and format (e.g. 'JPEG'). The header is parsed as the first chunks arrive,
+    and if it shows the image is too small to be a dog the download is abandoned and None is returned in place of the
+    bytes.
+    """
+    parser = ImageFile.Parser()
+    chunks = []
+    with http_client.get(url, stream=True) as resp:
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            chunks.append(chunk)
+            if parser.image is None:
+                parser.feed(chunk)
+                if parser.image is not None and min(parser.image.size) < MIN_DOG_SIZE:
+                    return None, parser.image.format
+    if parser.image is None:
+        raise UnidentifiedImageError(f'cannot identify image file from {url}')
+    return b''.join(chunks), parser.image.format
+
+
+def get_content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(img, hash_size=8):
+    """Difference hash - one bit per pair of horizontally adjacent pixels in a tiny greyscale thumbnail"""
+    width = hash_size + 1
+    pixels = list(img.convert('L').resize((width, hash_size), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[row * width + col] > pixels[row * width + col + 1])
+    return bits
+
+
+def save_image(data, filepath):
+    """Write the image bytes as downloaded, without re-encoding, and return the image's perceptual hash"""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    img = Image.open(io.BytesIO(data))
+    # The hash only needs a tiny thumbnail, so let JPEGs decode at a fraction of their full size
+    img.draft('RGB', (64, 64))
+    return dhash(img)
+
+
+def get_image_filepath(content_hash, img_format):
+    """
+    Images are stored by the hash of their contents, so identical images are only stored once no matter which url
+    they came from. They're sharded over two levels of subdirectories to keep each directory small.
+    """
+    ext = '.jpg' if img_format in (None, 'JPEG', 'MPO') else f'.{img_format.lower()}'
+    return os.path.join(IMAGE_DIR, content_hash[:2], content_hash[2:4], content_hash + ext)
@@ -0,0 +1,68 @@
+import selenium.common.exceptions
+
+
+# Requests a lean browser refuses: fonts, audio and video, and analytics/advertising/embed scripts from other sites.
+# Images are turned off separately, with a content setting (see enable).
+BLOCKED_URLS = [
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.ogg',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*googleadservices.com*', '*hotjar.com*', '*clarity.ms*', '*newrelic.com*', '*nr-data.net*', '*bat.bing.com*',
+    '*connect.facebook.net*', '*youtube.com*', '*vimeo.com*', '*tiktok.com*', '*zendesk.com*', '*intercom.io*',
+]
+# Patterns in BLOCKED_URLS that a source still needs, by the first word of its name (so 'FB' covers every group and
+# page)
+ALLOWED_URLS = {
+    # Left alone for petbarn, whose results widget may be pulled in through its tag manager
+    'petbarn': ['*googletagmanager.com*'],
+}
+
+
+def enable(chrome_options):
+    """Stop a browser from downloading images. The rest is blocked per source, with block_for."""
+    chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+
+def block_for(driver, source):
+    """Block BLOCKED_URLS in the driver, except those the source needs"""
+    allowed = ALLOWED_URLS.get(source.split()[0], [])
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': [url for url in BLOCKED_URLS if url not in allowed]})
+    except selenium.common.exceptions.WebDriverException:
+        # Not Chrome, or a version without CDP - carry on loading everything
+        pass
+
+
+if __name__ == '__main__':
+    # Compare load time, bytes transferred and browser memory for each site, with a normal and a lean browser
+    import sys
+    import time
+
+    import driver_pool
+    import scrape
+
+    sites = {
+        'adoptapet': 'https://www.adoptapet.com.au/',
+        'saveadog': 'https://saveadog.org.au/animals-adoptions/dog/small-dogs',
+        'rspca': 'https://rspcavic.org/adoption/Search/?animal=Dog&location=&keywords=&seed=9&page=1',
+        'petbarn': 'https://www.petbarn.com.au/petspot/dog-adoptions/',
+        'FB page': 'https://touch.facebook.com/DogRescueAssociationofVictoria/posts',
+    }
+    transferred_js = "return performance.getEntriesByType('resource').reduce((total, r) => total + r.transferSize, 0);"
+
+    for lean in (False, True):
+        driver = scrape.create_driver(headless='--headless' in sys.argv, lean=lean)
+        try:
+            for source, url in sites.items():
+                if lean:
+                    block_for(driver, source)
+                start_time = time.time()
+                driver.get(url)
+                duration = time.time() - start_time
+                kb = driver.execute_script(transferred_js) / 1024
+                rss_mb = driver_pool.process_tree_rss_mb(driver.service.process.pid)
+                print(f'{"lean" if lean else "normal":<7} {source:<10} {duration:6.1f}s {kb:9.0f} KiB '
+                      f'{rss_mb or 0:7.0f} MiB browser memory', flush=True)
+        finally:
+            driver.quit()
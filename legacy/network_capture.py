@@ -0,0 +1,93 @@
+import base64
+import json
+from urllib.parse import urljoin
+
+import selenium.common.exceptions
+
+
+# Keys (compared lower case, ignoring '_' and '-') that hold a listing's page url, and its image url or an object or
+# list of objects holding one
+LINK_KEYS = {'url', 'link', 'href', 'permalink', 'detailurl', 'detailsurl', 'profileurl', 'enquiryurl', 'enquireurl',
+             'adoptionurl', 'listingurl'}
+IMAGE_KEYS = {'image', 'imageurl', 'images', 'img', 'imgurl', 'photo', 'photourl', 'photos', 'thumbnail',
+              'thumbnailurl', 'picture', 'primaryphoto', 'mainimage'}
+
+
+def enable(chrome_options):
+    """Have Chrome log network events, so the responses behind a page can be read back with json_responses"""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+
+def drain(driver):
+    """Discard anything captured so far, so the next read only sees responses from here on"""
+    driver.get_log('performance')
+
+
+def json_responses(driver, url_contains=''):
+    """(url, parsed body) of the JSON responses from matching urls that the page has received since the last read"""
+    payloads = []
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        if message['method'] != 'Network.responseReceived':
+            continue
+        response = message['params']['response']
+        if 'json' not in response['mimeType'] or url_contains not in response['url']:
+            continue
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': message['params']['requestId']})
+            text = base64.b64decode(body['body']) if body['base64Encoded'] else body['body']
+            payloads.append((response['url'], json.loads(text)))
+        except (selenium.common.exceptions.WebDriverException, ValueError):
+            # Evicted from the browser's buffer, or not actually JSON
+            continue
+    return payloads
+
+
+def _normalise_key(key):
+    return key.lower().replace('_', '').replace('-', '')
+
+
+def _first_url(value):
+    if isinstance(value, str):
+        return value if value.startswith(('http', '/')) else None
+    if isinstance(value, list):
+        for item in value:
+            if url := _first_url(item):
+                return url
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if _normalise_key(key) in LINK_KEYS | IMAGE_KEYS | {'src', 'large', 'medium', 'original'}:
+                if url := _first_url(item):
+                    return url
+    return None
+
+
+def find_listings(payload, base_url):
+    """(href, img_src) for every object in a JSON payload that has both a link and an image"""
+    listings = []
+    if isinstance(payload, list):
+        for item in payload:
+            listings.extend(find_listings(item, base_url))
+    elif isinstance(payload, dict):
+        href = img_src = None
+        for key, value in payload.items():
+            normalised = _normalise_key(key)
+            if normalised in LINK_KEYS and isinstance(value, str) and href is None:
+                href = _first_url(value)
+            elif normalised in IMAGE_KEYS and img_src is None:
+                img_src = _first_url(value)
+        if href and img_src:
+            listings.append((urljoin(base_url, href), urljoin(base_url, img_src)))
+        else:
+            for value in payload.values():
+                listings.extend(find_listings(value, base_url))
+    return listings
+
+
+def listings(driver, url_contains=''):
+    """Listings found in the JSON responses from matching urls received since the last read, without duplicates"""
+    found = {}
+    for url, payload in json_responses(driver, url_contains):
+        for href, img_src in find_listings(payload, url):
+            found.setdefault(href, img_src)
+    return list(found.items())
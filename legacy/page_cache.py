@@ -0,0 +1,37 @@
+import hashlib
+import threading
+
+import http_client
+
+
+# url -> (ETag, Last-Modified, sha256 of the body) of the last response that was scraped in full
+_entries = {}
+_lock = threading.Lock()
+
+
+def get(url, **kwargs):
+    """GET a page, asking the server to reply 304 Not Modified if it hasn't changed since it was last scraped"""
+    with _lock:
+        etag, last_modified, _ = _entries.get(url, (None, None, None))
+    headers = dict(kwargs.pop('headers', None) or {})
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return http_client.get(url, headers=headers, **kwargs)
+
+
+def unchanged(url, resp):
+    """Whether the response is the page as it was last scraped, going by its status or else by its content"""
+    with _lock:
+        entry = _entries.get(url)
+    if entry is None:
+        return False
+    return resp.status_code == 304 or (resp.ok and hashlib.sha256(resp.content).hexdigest() == entry[2])
+
+
+def remember(url, resp):
+    """Record a response once it has been scraped in full, so an unchanged copy of it can be skipped next time"""
+    with _lock:
+        _entries[url] = (resp.headers.get('ETag'), resp.headers.get('Last-Modified'),
+                         hashlib.sha256(resp.content).hexdigest())
@@ -9,9 +9,7 @@ from threading import Thread
 import argparse
 
 import database as db
-
-
-CHECK_INTERVAL_MINUTES = 15
+import scheduler
 
 
 def parse_args():
@@ -25,25 +23,40 @@ def parse_args():
                         help='Don\'t scrape on launch, wait the predetermined time first.',
                         action='store_true',
                         required=False)
+    parser.add_argument('--fb-login',
+                        help='Ask for Facebook credentials even if there is a saved session.',
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--scrape-workers',
+                        help='Number of scrape sources (or browser sessions) to run at once.',
+                        type=int,
+                        default=scrape.SCRAPE_WORKERS,
+                        required=False)
 
     return parser.parse_args()
 
 
-def check_new_dogs(skip_scraping=False, headless=False):
+def check_new_dogs(skip_scraping=False, headless=False, scrape_workers=scrape.SCRAPE_WORKERS, pool=None,
+                   sources=None):
+    """Scrape (the given sources, or all of them), then classify and notify. Returns the scrape's SourceResults."""
+    report = []
     if not skip_scraping:
         print('SCRAPING DOGS')
-        scrape.scrape(headless=headless)
+        report = scrape.scrape(headless=headless, workers=scrape_workers, pool=pool, sources=sources)
 
     unclassified = db.get_unclassified()
     print(f'{len(unclassified)} dogs to classify')
     if unclassified:
         print('\nCLASSIFYING DOGS')
-        for url, info in tqdm.tqdm(unclassified.items()):
-            db.set_desired(url, *classify(info['img']))
+        with db.transaction():
+            for url, info in tqdm.tqdm(unclassified.items()):
+                db.set_desired(url, *classify(info['img']))
 
     unnotified_keys = list(db.get_unnotified().keys())
     if unnotified_keys:
         print('NEW NOTIFICATIONS!')
+        # Not batched into a transaction - each alert is persisted as sent as soon as it goes out, so a later alert
+        # failing can't roll it back and have it sent again
         for i, url in enumerate(unnotified_keys):
             print(f'({i+1})\t{url}')
             wandb.alert(title=f'DOG ALERT {i+1}/{len(unnotified_keys)}',
@@ -51,25 +64,40 @@ def check_new_dogs(skip_scraping=False, headless=False):
                         level=wandb.AlertLevel.WARN,
                         wait_duration=datetime.timedelta(seconds=0))
             db.set_notified(url)
+    return report
 
 
 if __name__ == '__main__':
     args = parse_args()
-    scrape.set_login_credentials()
+    scrape.set_login_credentials(force=args.fb_login)
     
     wandb.login()
     wandb.init('WatchDog')
     web_app_thread = Thread(target=web.run)
     web_app_thread.start()
 
+    # Browsers are kept open between checks rather than started from scratch each time
+    pool = scrape.create_driver_pool(headless=args.headless)
+
+    # Each check only scrapes the sources that are due, which are polled more or less often depending on how many new
+    # listings they turn up. Checks run one after another, so a source is never scraped twice at once.
+    source_scheduler = scheduler.SourceScheduler(scrape.source_names())
     skip_scraping = args.skip_first_scrape
-    while True:
-        start_time = time.time()
-        check_new_dogs(skip_scraping=skip_scraping, headless=args.headless)
-        duration = time.time() - start_time
-        print(f'\nCheck complete at {datetime.datetime.now()}')
-        print(f'Duration: {round(duration)} seconds.')
-        print(f'Sleeping for {CHECK_INTERVAL_MINUTES} minutes...\n')
+    try:
+        while True:
+            start_time = time.time()
+            sources = source_scheduler.due()
+            report = check_new_dogs(skip_scraping=skip_scraping, headless=args.headless,
+                                    scrape_workers=args.scrape_workers, pool=pool, sources=sources)
+            for result in report:
+                source_scheduler.record(result)
+            duration = time.time() - start_time
+            print(f'\nCheck complete at {datetime.datetime.now()}')
+            print(f'Duration: {round(duration)} seconds.')
 
-        time.sleep(CHECK_INTERVAL_MINUTES * 60)
-        skip_scraping = False
+            sleep_seconds = scheduler.MIN_INTERVAL_MINUTES * 60 if skip_scraping else source_scheduler.seconds_until_due()
+            print(f'Sleeping for {sleep_seconds / 60:.1f} minutes...\n')
+            time.sleep(sleep_seconds)
+            skip_scraping = False
+    finally:
+        pool.close()
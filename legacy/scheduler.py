@@ -0,0 +1,109 @@
+import random
+import time
+
+
+# Bounds on how often a source is polled
+MIN_INTERVAL_MINUTES = 5
+MAX_INTERVAL_MINUTES = 120
+# Sources are polled about as often as it takes them to have this many new listings
+TARGET_NEW_PER_POLL = 1
+# Intervals are randomly stretched or shrunk by up to this fraction, so sources drift apart rather than all falling
+# due in the same cycle forever
+JITTER = 0.2
+# Weight given to the latest poll in each source's running new-listing rate and cost
+SMOOTHING = 0.3
+# A failing source is retried after MIN_INTERVAL_MINUTES, doubling with each failure in a row up to
+# MAX_INTERVAL_MINUTES. After BREAKER_FAILURES in a row it is left alone for COOL_OFF_MINUTES, then given a single
+# trial run.
+BREAKER_FAILURES = 4
+COOL_OFF_MINUTES = 6 * 60
+# Total seconds of scraping (summed across sources, however many run at once) to schedule in a cycle
+CYCLE_BUDGET_SECONDS = 30 * 60
+
+
+class SourceStats:
+    def __init__(self):
+        # New listings per hour, and seconds per poll, as running averages. The rate is None until the second poll.
+        self.rate = None
+        self.cost = None
+        self.last_run = None
+        self.next_due = 0
+        # Failed polls in a row
+        self.failures = 0
+
+
+class SourceScheduler:
+    """
+    Decides which scrape sources to run each cycle. Each source is polled at an interval aimed at catching about
+    TARGET_NEW_PER_POLL new listings, so busy sources are polled often and quiet ones rarely. When more is due than
+    fits in the cycle's budget, the sources with the most expected new listings per second of scraping go first.
+    """
+
+    def __init__(self, names):
+        self.stats = {name: SourceStats() for name in names}
+
+    def _priority(self, name, now):
+        stats = self.stats[name]
+        if stats.rate is None:
+            return float('inf')
+        expected_new = stats.rate * (now - stats.last_run) / 3600
+        return expected_new / max(stats.cost, 1)
+
+    def due(self, now=None):
+        """The sources to run this cycle - always at least one if any are due"""
+        now = time.time() if now is None else now
+        due = [name for name, stats in self.stats.items() if stats.next_due <= now]
+        due.sort(key=lambda name: self._priority(name, now), reverse=True)
+        chosen, planned = [], 0
+        for name in due:
+            cost = self.stats[name].cost or 0
+            if chosen and planned + cost > CYCLE_BUDGET_SECONDS:
+                # Stays due, with its priority growing, until there's room
+                continue
+            chosen.append(name)
+            planned += cost
+        return chosen
+
+    def record(self, result, now=None):
+        """
+        Update a source's cost, and its rate or failure count, from its SourceResult (see source_executor), and schedule
+        its next poll
+        """
+        now = time.time() if now is None else now
+        stats = self.stats.setdefault(result.name, SourceStats())
+        if result.deferred:
+            # Never got to run (e.g. its lane timed out on another source), which says nothing about how it's doing -
+            # try again soon, without counting it as a failure
+            stats.next_due = now + MIN_INTERVAL_MINUTES * 60
+            return
+        stats.cost = result.duration if stats.cost is None else \
+            SMOOTHING * result.duration + (1 - SMOOTHING) * stats.cost
+        if result.error:
+            stats.failures += 1
+            if stats.failures >= BREAKER_FAILURES:
+                print(f'Skipping {result.name} for {COOL_OFF_MINUTES} minutes after {stats.failures} failures in a row')
+                stats.next_due = now + COOL_OFF_MINUTES * 60
+            else:
+                backoff = min(MIN_INTERVAL_MINUTES * 2 ** (stats.failures - 1), MAX_INTERVAL_MINUTES)
+                stats.next_due = now + backoff * 60 * random.uniform(1, 1 + JITTER)
+            return
+        stats.failures = 0
+        if stats.last_run is None:
+            # The first poll since starting has nothing to measure from - its listings are usually all in the database
+            # already, or all new to an empty one - so the rate is measured from the next poll, soon after
+            stats.last_run = now
+            stats.next_due = now + MIN_INTERVAL_MINUTES * 60
+            return
+        hours = (now - stats.last_run) / 3600
+        rate = result.new_dogs / hours
+        stats.rate = rate if stats.rate is None else SMOOTHING * rate + (1 - SMOOTHING) * stats.rate
+        stats.last_run = now
+        # Aim for TARGET_NEW_PER_POLL new listings per poll, polling sources that never have any as rarely as allowed
+        interval = TARGET_NEW_PER_POLL / stats.rate * 3600 if stats.rate else MAX_INTERVAL_MINUTES * 60
+        interval = min(max(interval, MIN_INTERVAL_MINUTES * 60), MAX_INTERVAL_MINUTES * 60)
+        stats.next_due = now + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def seconds_until_due(self, now=None):
+        """How long until the next source is due, or 0 if one already is"""
+        now = time.time() if now is None else now
+        return max(0, min(stats.next_due for stats in self.stats.values()) - now)
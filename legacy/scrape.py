@@ -1,80 +1,177 @@
+import json
 import time
 import selenium.common.exceptions
-import requests
 from bs4 import BeautifulSoup
 import os
-from urllib.parse import urlparse
+from urllib.parse import urljoin
 from selenium import webdriver
+from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.support.ui import WebDriverWait, Select
 import PIL
+import requests
 from getpass import getpass
 
+import async_fetch
 import database as db
+import driver_pool
+import html_listings
+import http_client
+import lean_browser
+import network_capture
+import page_cache
+import source_executor
 
 
 EMAIL = PWD = None
+# Cookies from the last Facebook login, reused across checks and restarts until the session stops working. Kept out
+# of the working directory, which web.py serves as static assets.
+FB_COOKIES_PATH = os.path.join(os.path.expanduser('~'), '.config', 'watchdog', 'fb_cookies.json')
 
 
-def set_login_credentials():
+def set_login_credentials(force=False):
+    """Prompt for Facebook credentials, unless there is a saved session to use instead"""
     global EMAIL, PWD
+    if not force and os.path.exists(FB_COOKIES_PATH):
+        return
     print('Enter Facebook credentials:')
     EMAIL = input('Email: ')
     PWD = getpass()
 
 
-def scrape_generic(url):
-    resp = requests.get(url)
+# Incremental scrapes stop paginating once this many pages in a row had only listings already in the database, with a
+# full sweep of every page on every FULL_SWEEP_EVERY-th scrape of each source (starting with the first) to catch
+# anything missed
+KNOWN_PAGES_BEFORE_STOP = 1
+FULL_SWEEP_EVERY = 12
+# Source name -> times it has been scraped
+scrape_counts = {}
+# Read adoptapet and petbarn listings from the JSON their results pages are rendered from, where it can be found,
+# rather than out of the page itself
+USE_NETWORK_CAPTURE = True
+# Only JSON from each site's search results endpoint is read for listings, so config, analytics and the like can't
+# be mistaken for them. If a site moves its endpoint nothing matches, and its listings are read from the page instead.
+ADOPTAPET_RESULTS_URL = 'adoptapet.com.au/api/search'
+PETBARN_RESULTS_URL = 'petbarn.com.au/petspot/api/'
+# Attempts at loading a page or adding a listing before giving up on it. Giving up on a page fails its source, which
+# is then backed off by the run loop's scheduler.
+PAGE_ATTEMPTS = 3
+# Errors worth another attempt - a slow or flaky page or image host. Anything else, like an element that isn't there
+# because a site's layout has changed, fails straight away.
+RETRYABLE_ERRORS = (selenium.common.exceptions.TimeoutException,
+                    selenium.common.exceptions.StaleElementReferenceException, requests.RequestException)
+# Try fetching saveadog and rspca pages over plain HTTP before loading them in a browser
+USE_HTTP_FAST_PATH = True
+# Browsers skip images, fonts, media and tracking scripts (see lean_browser), as only the listings' urls are needed
+LEAN_BROWSER = True
+
+
+def _stop_paginating(known_pages, full_sweep):
+    return not full_sweep and known_pages >= KNOWN_PAGES_BEFORE_STOP
+
+
+def _all_known(listings):
+    """
+    Whether a results page's listings were all in the database before it was scraped. Going by what add returned
+    instead would count a page whose new listings all failed to download as known.
+    """
+    return bool(listings) and all(db.already_scraped(href, img_src) for href, img_src in listings)
+
+
+def _captured_listings(driver, url_contains):
+    """Listings from the site's JSON responses since the last call, or [] to fall back to reading the page"""
+    if not USE_NETWORK_CAPTURE:
+        return []
+    return network_capture.listings(driver, url_contains)
+
+
+def _capture_matches(source, captured, page_hrefs):
+    """
+    Whether listings captured from a site's JSON are under the same urls as the page links listings have always been
+    stored under, so dogs already in the database don't come back as new. Checked once per scrape, against the first
+    page that had any.
+    """
+    captured_hrefs = {href for href, _ in captured}
+    if page_hrefs and all(href in captured_hrefs for href in page_hrefs):
+        return True
+    print(f'{source} JSON listings don\'t match the links on its page, reading the page instead')
+    return False
+
+
+def parse_listings(url, html, item_class=None):
+    """
+    (href, img_src) pairs from a page's html. With item_class, the first link and image in each element of that class,
+    otherwise every linked jpg image on the page.
+    """
+    if item_class is None:
+        return html_listings.linked_jpgs(url, html)
+    listings = []
+    for item in BeautifulSoup(html, 'html.parser').find_all(class_=item_class):
+        link, img = item.find('a', href=True), item.find('img')
+        # Lazy loaded images only have a placeholder src until the page's scripts run
+        src = img and (img.get('data-src') or img.get('src'))
+        if link and src and not src.startswith('data:'):
+            listings.append((urljoin(url, link['href']), urljoin(url, src)))
+    return listings
+
+
+def scrape_generic_response(url, resp, full_sweep=False):
+    new_dogs = 0
+    # Everything on a page that hasn't changed since it was last scraped is already in the database
+    if not full_sweep and page_cache.unchanged(url, resp):
+        return new_dogs
     if resp.ok:
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        for img in soup.findAll('img'):
-            if 'src' in img.attrs:
-                for key in ['src', 'data-src']:
-                    if key not in img.attrs:
-                        continue
-                    src = img.attrs[key]
-                    if not src.startswith('http'):
-                        parsed_url = urlparse(url)
-                        src = f'{parsed_url.scheme}://{parsed_url.netloc}{src}'
-                    filename = os.path.basename(src)
-                    if '?' in filename:
-                        filename = filename[:filename.index('?')]
-                    if filename.lower().endswith('jpg') or filename.lower().endswith('jpeg'):
-                        parent = img.parent
-                        while parent and parent.name != 'a':
-                            parent = parent.parent
-                        if parent:
-                            href = parent.attrs['href']
-                            db.add(url=href, img_url=src)
-
-
-def scrape_dogshome():
-    print('Scraping dogshome.com... ', end='', flush=True)
-    start_count = db.count()
-
-    scrape_generic(
-        'https://dogshome.com/dog-adoption/adopt-a-dog/?sex=&breed1=&age=&animalid=&Submit=Submit&resulttype=1')
-    scrape_generic(
-        'https://dogshome.com/dog-adoption/adopt-a-dog/?age=&sex=&breed1=&resulttype=1&ShelterLocation=&Submit=Submit&pageno=2')
-    scrape_generic(
-        'https://dogshome.com/dog-adoption/adopt-a-dog/?age=&sex=&breed1=&resulttype=1&ShelterLocation=&Submit=Submit&pageno=3')
-    scrape_generic(
-        'https://dogshome.com/dog-adoption/adopt-a-dog/?age=&sex=&breed1=&resulttype=1&ShelterLocation=&Submit=Submit&pageno=4')
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
-
-
-def scrape_petrescue():
-    print('Scraping www.petrescue.com.au... ', end='', flush=True)
-    start_count = db.count()
-
-    scrape_generic(
-        'https://www.petrescue.com.au/listings/search/dogs?interstate=false&page=1&per_page=500&size%5B%5D=10&state_id%5B%5D=2')
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
-
-
-def scrape_adoptapet(driver):
-    print('Scraping www.adoptapet.com.au... ', end='', flush=True)
-    start_count = db.count()
+        listings = parse_listings(url, resp.text)
+        for href, src in listings:
+            new_dogs += add_listing(href, src)
+        # A listing skipped after failing to download is left for the next poll to try again, rather than the page
+        # being passed over as unchanged until the next full sweep
+        if all(db.already_scraped(href, src) for href, src in listings):
+            page_cache.remember(url, resp)
+    return new_dogs
+
+
+def _http_listings(url, item_class):
+    """Listings parsed from a plain GET of the page, or [] if there are none (or the site needs a browser)"""
+    if not USE_HTTP_FAST_PATH:
+        return []
+    try:
+        resp = http_client.get(url)
+    except requests.RequestException:
+        return []
+    return parse_listings(url, resp.text, item_class) if resp.ok else []
+
+
+def _get_page(url, full_sweep):
+    # Full sweeps need the whole page, rather than a 304 for one that hasn't changed
+    return http_client.get(url) if full_sweep else page_cache.get(url)
+
+
+def scrape_generic(url, full_sweep=False):
+    return scrape_generic_response(url, _get_page(url, full_sweep), full_sweep)
+
+
+def scrape_generic_pages(urls, full_sweep=False):
+    """Fetch all of the pages at once, scraping each as soon as it arrives"""
+    return sum(async_fetch.fetch_all(urls, lambda url, resp: scrape_generic_response(url, resp, full_sweep),
+                                     get=lambda url: _get_page(url, full_sweep)))
+
 
+def scrape_dogshome(full_sweep=False):
+    return scrape_generic_pages([
+        'https://dogshome.com/dog-adoption/adopt-a-dog/?sex=&breed1=&age=&animalid=&Submit=Submit&resulttype=1',
+        'https://dogshome.com/dog-adoption/adopt-a-dog/?age=&sex=&breed1=&resulttype=1&ShelterLocation=&Submit=Submit&pageno=2',
+        'https://dogshome.com/dog-adoption/adopt-a-dog/?age=&sex=&breed1=&resulttype=1&ShelterLocation=&Submit=Submit&pageno=3',
+        'https://dogshome.com/dog-adoption/adopt-a-dog/?age=&sex=&breed1=&resulttype=1&ShelterLocation=&Submit=Submit&pageno=4',
+    ], full_sweep)
+
+
+def scrape_petrescue(full_sweep=False):
+    return scrape_generic_pages([
+        'https://www.petrescue.com.au/listings/search/dogs?interstate=false&page=1&per_page=500&size%5B%5D=10&state_id%5B%5D=2',
+    ], full_sweep)
+
+
+def _adoptapet_search(driver):
     driver.get('https://www.adoptapet.com.au/')
 
     # Close the covid info popup
@@ -104,40 +201,57 @@ def scrape_adoptapet(driver):
         Select(state_select).select_by_value('3')  # Victoria
 
     # Submission
-    time.sleep(2)
-    search_btn = selenium_get_with_wait(driver, lambda d: d.find_element_by_xpath(
-        '//*[@id="search-button-bott"]/button'))
+    search_btn = selenium_get_with_wait(driver, expected_conditions.element_to_be_clickable(
+        ('xpath', '//*[@id="search-button-bott"]/button')))
     if search_btn:
+        if USE_NETWORK_CAPTURE:
+            network_capture.drain(driver)
         search_btn.click()
 
+
+def scrape_adoptapet(driver, full_sweep=False):
+    new_dogs = 0
+    retry(lambda: _adoptapet_search(driver))
+
     # Account for multiple pages
     more_pets = True
+    known_pages = 0
+    # Whether to go by captured JSON, decided by _capture_matches on the first page that has some
+    use_capture = None
     while more_pets:
-        time.sleep(1)
-        for pet in selenium_get_with_wait(driver, lambda d: d.find_elements_by_class_name('pet')):
-            href = img_src = None
-            link = pet.find_element_by_tag_name('a')
-            if link:
-                href = link.get_attribute('href')
-            img = pet.find_element_by_tag_name('img')
-            if img:
-                img_src = img.get_attribute('src')
-            if href and img_src:
-                db.add(url=href, img_url=img_src)
+        pets = selenium_get_with_wait(driver, lambda d: d.find_elements_by_class_name('pet'))
+        captured = _captured_listings(driver, ADOPTAPET_RESULTS_URL) if use_capture is not False else []
+        page_listings = extract_listings(driver, '.pet') if pets and not use_capture else []
+        if captured and use_capture is None:
+            use_capture = _capture_matches('adoptapet', captured, [href for href, _ in page_listings if href])
+        listings = captured if use_capture else page_listings
+        listings = [(href, img_src) for href, img_src in listings if href and img_src]
+        known_pages = known_pages + 1 if _all_known(listings) else 0
+        for href, img_src in listings:
+            new_dogs += add_listing(href, img_src)
+        if _stop_paginating(known_pages, full_sweep):
+            break
         if search_btn := selenium_get_with_wait(driver, lambda d: d.find_element_by_xpath('//*[@id="go-to-search-page"]/div/div/a')):
             search_btn.click()
+            # Don't read the next page until this one's pets have gone
+            if pets:
+                selenium_get_with_wait(driver, expected_conditions.staleness_of(pets[0]))
         else:
             more_pets = False
 
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
+    return new_dogs
 
 
 def selenium_get_with_wait(driver, lambdaa, timeout=3):
+    """Wait for lambdaa(driver) to return something truthy, returning [] if it doesn't within timeout seconds"""
     elements = []
+    start_time = time.time()
+    timed_out = False
     try:
         elements = WebDriverWait(driver, timeout=timeout).until(lambdaa)
     except selenium.common.exceptions.TimeoutException:
-        pass
+        timed_out = True
+    source_executor.record_wait(time.time() - start_time, timed_out)
     return elements
 
 
@@ -150,74 +264,81 @@ def selenium_try_click(element):
         pass
 
 
-def retry_selenium(driver, func, n_times=3):
-    attempt = 0
-    while attempt < n_times:
+def retry(func, attempts=PAGE_ATTEMPTS):
+    """Call func, trying again after an exponentially growing pause if it raises one of RETRYABLE_ERRORS"""
+    for attempt in range(attempts):
         try:
-            return func(driver)
-        except:
-            attempt += 1
-    print(f'Failed after {n_times} attempts.')
-    return {}
+            return func()
+        except RETRYABLE_ERRORS:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(2 ** attempt)
 
 
-def scrape_saveadog(driver):
-    print('Scraping saveadog.org.au... ', end='', flush=True)
-    start_count = db.count()
+def add_listing(href, img_src):
+    """db.add, retrying just this listing if its image fails to download, and skipping it if it keeps failing"""
+    try:
+        return retry(lambda: db.add(url=href, img_url=img_src))
+    except (requests.RequestException, PIL.UnidentifiedImageError) as e:
+        print(f'Skipping {href}: {e!r}')
+        return 0
 
-    for category in ('small-dogs', 'puppies'):
-        driver.get(f'https://saveadog.org.au/animals-adoptions/dog/{category}')
 
-        modal_close = selenium_get_with_wait(
-            driver, lambda d: d.find_elements_by_class_name('mmodal__close'))
-        if modal_close:
-            selenium_try_click(modal_close[0])
+def _browser_listings(driver, url, modal_close_selector, item_class):
+    """Load a page in the browser, dismissing its popup, and return its listings"""
+    driver.get(url)
 
-        dog_boxes = selenium_get_with_wait(
-            driver, lambda d: d.find_elements_by_class_name('animal-box-inner'))
-        for dog_box in dog_boxes:
-            img_src = dog_box.find_element_by_tag_name(
-                'img').get_attribute('src')
-            href = dog_box.find_element_by_tag_name('a').get_attribute('href')
-            if img_src:
-                db.add(url=href, img_url=img_src)
+    modal_close = selenium_get_with_wait(
+        driver, lambda d: d.find_elements_by_css_selector(modal_close_selector))
+    if modal_close:
+        selenium_try_click(modal_close[0])
 
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
+    if selenium_get_with_wait(driver, lambda d: d.find_elements_by_class_name(item_class)):
+        return extract_listings(driver, f'.{item_class}')
+    return []
 
 
-def scrape_rspca(driver):
-    print('Scraping rspcavic.org... ', end='', flush=True)
-    start_count = db.count()
+def scrape_saveadog(driver, full_sweep=False):
+    new_dogs = 0
 
-    page = 1
-    while True:
-        driver.get(
-            f'https://rspcavic.org/adoption/Search/?animal=Dog&location=&keywords=&seed=9&page={page}')
+    for category in ('small-dogs', 'puppies'):
+        url = f'https://saveadog.org.au/animals-adoptions/dog/{category}'
+        listings = _http_listings(url, 'animal-box-inner') or \
+            retry(lambda: _browser_listings(driver, url, '.mmodal__close', 'animal-box-inner'))
+        for href, img_src in listings:
+            if href and img_src:
+                new_dogs += add_listing(href, img_src)
 
-        modal_close = selenium_get_with_wait(
-            driver, lambda d: d.find_elements_by_id('danqam'))
-        if modal_close:
-            selenium_try_click(modal_close[0])
+    return new_dogs
 
-        dog_boxes = selenium_get_with_wait(
-            driver, lambda d: d.find_elements_by_class_name('animalSearchImageWrapper'))
-        if len(dog_boxes) == 0:
+
+def scrape_rspca(driver, full_sweep=False):
+    new_dogs = 0
+
+    page = 1
+    # Decided by the first page - an empty page after that is the end of the results either way
+    use_http = None
+    # Every page is read, as results come in a seeded shuffle rather than newest first, so a new dog can be on any of
+    # them
+    while True:
+        url = f'https://rspcavic.org/adoption/Search/?animal=Dog&location=&keywords=&seed=9&page={page}'
+        listings = _http_listings(url, 'animalSearchImageWrapper') if use_http is not False else []
+        if use_http is None:
+            use_http = bool(listings)
+
+        if not use_http:
+            listings = retry(lambda: _browser_listings(driver, url, '#danqam', 'animalSearchImageWrapper'))
+        if len(listings) == 0:
             break
-        for dog_box in dog_boxes:
-            img_src = dog_box.find_element_by_tag_name(
-                'img').get_attribute('src')
-            href = dog_box.find_element_by_tag_name('a').get_attribute('href')
-            if img_src:
-                db.add(url=href, img_url=img_src)
+        for href, img_src in listings:
+            if href and img_src:
+                new_dogs += add_listing(href, img_src)
         page += 1
 
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
+    return new_dogs
 
 
-def scrape_petbarn(driver):
-    print('Scraping petbarn.com.au... ', end='', flush=True)
-    start_count = db.count()
-
+def _petbarn_search(driver):
     driver.get(f'https://www.petbarn.com.au/petspot/dog-adoptions/')
 
     show_filter_btn = selenium_get_with_wait(
@@ -231,7 +352,8 @@ def scrape_petbarn(driver):
     state_select = None
     if state_select_div:
         state_select = state_select_div.find_element_by_tag_name('select')
-    time.sleep(1)
+        # The options are filled in after the page loads
+        selenium_get_with_wait(driver, lambda d: state_select.find_elements_by_css_selector('option[value="VIC"]'))
 
     if state_select:
         Select(state_select).select_by_value('VIC')
@@ -247,41 +369,92 @@ def scrape_petbarn(driver):
     apply_btn = selenium_get_with_wait(
         driver, lambda d: d.find_element_by_id('filter-results'))
     if apply_btn:
+        if USE_NETWORK_CAPTURE:
+            network_capture.drain(driver)
         apply_btn.click()
 
+
+def _petbarn_popup_link(driver, dog):
+    """Open a listing's popup, returning the link to the listing in it (or None)"""
+    popup_btn = dog.find_element_by_class_name('sl-candidate-trigger')
+    if popup_btn:
+        driver.execute_script("arguments[0].click();", popup_btn)
+    button = selenium_get_with_wait(
+        driver, lambda d: d.find_element_by_class_name('enquire-now'))
+    if button:
+        return button.find_element_by_tag_name('a')
+    return None
+
+
+def _petbarn_first_href(driver, dog_boxes):
+    """The link in the first listing's popup, or None"""
+    if not dog_boxes:
+        return None
+    try:
+        link = retry(lambda: _petbarn_popup_link(driver, dog_boxes[0]))
+        return link.get_attribute('href') if link else None
+    except selenium.common.exceptions.WebDriverException:
+        return None
+    finally:
+        close_btn = selenium_get_with_wait(
+            driver, lambda d: d.find_element_by_class_name('sl-candidate-close'))
+        if close_btn:
+            close_btn.click()
+
+
+def scrape_petbarn(driver, full_sweep=False):
+    new_dogs = 0
+    retry(lambda: _petbarn_search(driver))
+
     more_pages = True
+    known_pages = 0
+    # Whether to go by captured JSON, decided by _capture_matches on the first page that has some
+    use_capture = None
     while more_pages:
         more_pages = False
         dog_boxes = selenium_get_with_wait(
             driver, lambda d: d.find_elements_by_class_name('sl-candidate'))
-        for dog in dog_boxes:
-            href = img_src = None
-            img = dog.find_element_by_class_name('sl-candidate-image')
-            if img:
-                img_src = get_img_src(img)
-            popup_btn = dog.find_element_by_class_name('sl-candidate-trigger')
-            if popup_btn:
-                driver.execute_script("arguments[0].click();", popup_btn)
-            button = selenium_get_with_wait(
-                driver, lambda d: d.find_element_by_class_name('enquire-now'))
-            if button:
-                link = button.find_element_by_tag_name('a')
-                if link:
-                    href = link.get_attribute('href')
+        page_new_dogs = 0
+        captured = _captured_listings(driver, PETBARN_RESULTS_URL) if use_capture is not False else []
+        if captured and use_capture is None:
+            first_href = _petbarn_first_href(driver, dog_boxes)
+            use_capture = _capture_matches('petbarn', captured, [first_href] if first_href else [])
+        if not use_capture:
+            captured = []
+        # Each listing is checked before it is added, as the popup listings' urls are only found one at a time
+        page_known = _all_known(captured) if captured else bool(dog_boxes)
+        for href, img_src in captured:
+            page_new_dogs += add_listing(href, img_src)
+        # Otherwise the images come in one go, but each listing's url is only in its popup
+        images = [] if captured else extract_listings(driver, '.sl-candidate', None, '.sl-candidate-image',
+                                                      css_background=True)
+        for dog, (_, img_src) in zip(dog_boxes, images):
+            href = None
+            try:
+                link = retry(lambda: _petbarn_popup_link(driver, dog))
+            except selenium.common.exceptions.WebDriverException as e:
+                # Move on to the next listing rather than failing the whole page
+                print(f'Skipping a petbarn listing: {e!r}')
+                page_known = False
+                continue
+            if link:
+                href = link.get_attribute('href')
+            page_known = page_known and _all_known([(href, img_src)])
 
             if href and img_src:
                 try:
-                    db.add(url=href, img_url=img_src)
+                    page_new_dogs += retry(lambda: db.add(url=href, img_url=img_src))
+                except requests.RequestException as e:
+                    print(f'Skipping {href}: {e!r}')
                 except PIL.UnidentifiedImageError:
                     # Probably a 404 - this happens from time to time on PetBarn.
                     # Navigate to the original listing and grab the image from there
                     link.click()
                     driver.switch_to.window(driver.window_handles[-1])
-                    time.sleep(1)
                     for img_div in selenium_get_with_wait(driver, lambda d: d.find_elements_by_class_name('dogCard')):
                         for img in img_div.find_elements_by_tag_name('img'):
                             img_src = get_img_src(img)
-                            db.add(url=href, img_url=img_src)
+                            page_new_dogs += add_listing(href, img_src)
                             break
                     driver.close()
 
@@ -289,6 +462,10 @@ def scrape_petbarn(driver):
                 driver, lambda d: d.find_element_by_class_name('sl-candidate-close'))
             if close_btn:
                 close_btn.click()
+        new_dogs += page_new_dogs
+        known_pages = known_pages + 1 if page_known else 0
+        if _stop_paginating(known_pages, full_sweep):
+            break
         pagination_div = selenium_get_with_wait(
             driver, lambda d: d.find_element_by_class_name('sl-pagination'))
         if pagination_div:
@@ -303,10 +480,13 @@ def scrape_petbarn(driver):
                         btn = child.find_element_by_tag_name('a')
                         if btn:
                             btn.click()
+                            # Don't read the next page until this one's dogs have gone
+                            if dog_boxes:
+                                selenium_get_with_wait(driver, expected_conditions.staleness_of(dog_boxes[0]))
                             more_pages = True
                             break
 
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
+    return new_dogs
 
 
 def _facebook_login(driver):
@@ -329,27 +509,110 @@ def _facebook_login(driver):
         not_now_btn.click()
 
 
-def scrape_fb_group(driver, group_id):
-    print(f'Scraping FB group {group_id}... ', end='', flush=True)
-    start_count = db.count()
-    scrape_fb_url(driver, f'https://touch.facebook.com/groups/{group_id}')
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
+def scrape_fb_group(driver, group_id, full_sweep=False):
+    return scrape_fb_url(driver, f'https://touch.facebook.com/groups/{group_id}', full_sweep)
+
+
+def scrape_fb_page(driver, page_name, full_sweep=False):
+    return scrape_fb_url(driver, f'https://touch.facebook.com/{page_name}/posts', full_sweep)
+
+
+def _fb_logged_in(driver):
+    # Facebook sets c_user for a logged in session, and shows the login form when it has been invalidated
+    return driver.get_cookie('c_user') is not None and not driver.find_elements_by_id('m_login_email')
 
 
-def scrape_fb_page(driver, page_name):
-    print(f'Scraping FB page {page_name}... ', end='', flush=True)
-    start_count = db.count()
-    scrape_fb_url(driver, f'https://touch.facebook.com/{page_name}/posts')
-    print(f'done - {db.count() - start_count} dogs scraped.', flush=True)
+def _load_fb_cookies(driver):
+    if not os.path.exists(FB_COOKIES_PATH):
+        return False
+    with open(FB_COOKIES_PATH, 'r') as f:
+        cookies = json.load(f)
+    for cookie in cookies:
+        try:
+            driver.add_cookie(cookie)
+        except selenium.common.exceptions.WebDriverException:
+            pass
+    return True
+
+
+def _save_fb_cookies(driver):
+    os.makedirs(os.path.dirname(FB_COOKIES_PATH), mode=0o700, exist_ok=True)
+    tmp_path = FB_COOKIES_PATH + '.tmp'
+    # Readable by the owner only - these are a logged in session
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+        json.dump(driver.get_cookies(), f)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, FB_COOKIES_PATH)
 
 
 def fb_login(driver):
+    """Make sure the driver is logged in to Facebook, going through the login form only if no session works"""
     driver.get('https://touch.facebook.com')
+    # A warm driver from the pool is usually still logged in from the last check
+    if _fb_logged_in(driver):
+        return
+    if _load_fb_cookies(driver):
+        driver.get('https://touch.facebook.com')
+        if _fb_logged_in(driver):
+            return
+        # Removed so that the next start asks for credentials, rather than trusting this session again
+        os.remove(FB_COOKIES_PATH)
+        print('Saved Facebook session has expired, logging in again')
+    if EMAIL is None or PWD is None:
+        raise RuntimeError('No working Facebook session - restart to enter credentials (or run with --fb-login)')
     _facebook_login(driver)
-
-
-def scrape_fb_url(driver, url):
-    return retry_selenium(driver, lambda d: _scrape_fb(d, url))
+    if _fb_logged_in(driver):
+        _save_fb_cookies(driver)
+
+
+def scrape_fb_url(driver, url, full_sweep=False):
+    return retry(lambda: _scrape_fb(driver, url, full_sweep))
+
+
+# In-browser equivalent of get_img_src (with cssBackground) or a plain src lookup, for the extraction scripts below
+IMG_SRC_JS = '''
+function imgSrc(img, cssBackground) {
+    if (!img) return null;
+    if (!cssBackground) return img.src || null;
+    if (img.parentElement && img.parentElement.tagName === 'SPAN') return null;
+    let src = img.src || null;
+    const background = getComputedStyle(img).backgroundImage;
+    if (background.includes('"')) src = background.slice(background.indexOf('"') + 1, background.lastIndexOf('"'));
+    return src;
+}
+'''
+
+# Finds [href, img_src] for every element matching a selector in a single script call, rather than several WebDriver
+# round trips per listing
+EXTRACT_LISTINGS_JS = IMG_SRC_JS + '''
+const [itemSelector, linkSelector, imgSelector, cssBackground] = arguments;
+return Array.from(document.querySelectorAll(itemSelector), item => {
+    const link = linkSelector ? item.querySelector(linkSelector) : null;
+    return [link ? link.href : null, imgSrc(item.querySelector(imgSelector), cssBackground)];
+});
+'''
+
+# [href, img_src] for every Facebook story on the page: the link in its _78cz div and the last image of the first of
+# the known image classes to have one
+EXTRACT_FB_STORIES_JS = IMG_SRC_JS + '''
+return Array.from(document.getElementsByClassName('_78cz'), linkDiv => {
+    const link = linkDiv.querySelector('a');
+    let story = linkDiv;
+    while (story && story.getAttribute('class') !== 'story_body_container') story = story.parentElement;
+    let src = null;
+    for (const imgClass of ['_5sgi', '_2sxw', 'datstx6m']) {
+        for (const img of story ? story.getElementsByClassName(imgClass) : []) src = imgSrc(img, true);
+        if (src) break;
+    }
+    return [link ? link.href : null, src];
+});
+'''
+
+
+def extract_listings(driver, item_selector, link_selector='a', img_selector='img', css_background=False):
+    """(href, img_src) of the first link and image in each element matching item_selector, in document order"""
+    return [tuple(pair) for pair in
+            driver.execute_script(EXTRACT_LISTINGS_JS, item_selector, link_selector, img_selector, css_background)]
 
 
 def get_img_src(img):
@@ -369,83 +632,188 @@ def get_img_src(img):
     return img_src
 
 
-def _scrape_fb(driver, url):
+def _scrape_fb(driver, url, full_sweep=False):
+    new_dogs = 0
     driver.get(url)
     selenium_get_with_wait(
         driver, lambda d: d.find_elements_by_class_name('_78cz'))
 
-    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(1)
-    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(1)
-
-    link_divs = driver.find_elements_by_class_name('_78cz')
-
-    for link_div in link_divs:
-        href = img_src = None
+    seen = set()
+    for scroll in range(FB_MAX_SCROLLS + 1):
+        stories = [story for story in driver.execute_script(EXTRACT_FB_STORIES_JS) if tuple(story) not in seen]
+        # Scrolling didn't turn up any more posts
+        if not stories:
+            break
+        seen.update(tuple(story) for story in stories)
 
-        if links := link_div.find_elements_by_tag_name('a'):
-            href = links[0].get_attribute('href').replace(
-                'm.facebook', 'facebook').replace('touch.facebook', 'facebook')
+        reached_known = False
+        for href, img_src in stories:
+            if href and img_src:
+                href = href.replace('m.facebook', 'facebook').replace('touch.facebook', 'facebook')
+                if db.already_scraped(href, img_src):
+                    reached_known = True
+                else:
+                    new_dogs += add_listing(href, img_src)
+        # Posts further down are older than one we already have. The rest of the batch is still checked, as pinned
+        # posts can be old ones sitting above new.
+        if (reached_known and not full_sweep) or scroll == FB_MAX_SCROLLS:
+            break
 
-        parent = link_div
-        while parent.get_attribute('class') != 'story_body_container':
-            parent = parent.find_element_by_xpath('..')
+        count_js = "return document.getElementsByClassName('_78cz').length;"
+        loaded = driver.execute_script(count_js)
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        selenium_get_with_wait(driver, lambda d: d.execute_script(count_js) > loaded)
+    return new_dogs
 
-        if parent:
-            for img_class in ['_5sgi', '_2sxw', 'datstx6m']:
-                for image in parent.find_elements_by_class_name(img_class):
-                    img_src = get_img_src(image)
-                if img_src:
-                    break
 
-        if href and img_src:
-            db.add(url=href, img_url=img_src)
+# Most times to scroll down a Facebook feed for more posts, when none of them are already known
+FB_MAX_SCROLLS = 5
+FB_GROUPS = ['571800346240922', '611101722623366']
+FB_PAGES = ['DogRescueAssociationofVictoria', 'vicdogrescue', 'StartingOverDogRescue', 'All4PawsDogRescue',
+            'SecondChanceAnimalRescueInc', 'PuppyTalesRescue', 'rescuedwithlove', 'FFARLatrobe', 'FFARau',
+            'LostDogsHome', 'PetRescueAU', 'RSPCA.Victoria', 'petshavenfoundation', 'Australiank9rescuevic',
+            'TheAnimalRehomingService', 'melbourneanimalrescue', 'newbeginnings.animalrescueinc',
+            'Krazy-Kat-Rescue-974224009276491']
 
+# Number of lanes (see source_executor) to run at once, and how long any one source may take before it's reported
+# as timed out
+SCRAPE_WORKERS = 4
+SOURCE_TIMEOUT_SECONDS = 10 * 60
+# How long a lane waits for a browser before failing its sources, e.g. when one is held by a lane that timed out
+BORROW_TIMEOUT_SECONDS = 2 * 60
 
-def scrape(headless=False):
-    global EMAIL, PWD
-    assert EMAIL is not None and PWD is not None, 'scrape.set_login_credentials must be called prior to scrape.scrape'
 
+def create_driver(headless=False, lean=None):
     chrome_options = webdriver.ChromeOptions()
     # This enables headless Chrome control so the window isn't opened and displayed
     if headless:
         chrome_options.headless = True
+    if LEAN_BROWSER if lean is None else lean:
+        lean_browser.enable(chrome_options)
+    if USE_NETWORK_CAPTURE:
+        network_capture.enable(chrome_options)
 
-    driver = webdriver.Chrome(
+    return webdriver.Chrome(
         executable_path='chromedriver_linux64/chromedriver', options=chrome_options)
 
-    scrape_dogshome()
-    scrape_petrescue()
-    retry_selenium(driver, scrape_adoptapet)
-    retry_selenium(driver, scrape_saveadog)
-    retry_selenium(driver, scrape_rspca)
-    retry_selenium(driver, scrape_petbarn)
-
-    fb_login(driver)
-    scrape_fb_group(driver, '571800346240922')
-    scrape_fb_group(driver, '611101722623366')
-    scrape_fb_page(driver, 'DogRescueAssociationofVictoria')
-    scrape_fb_page(driver, 'vicdogrescue')
-    scrape_fb_page(driver, 'StartingOverDogRescue')
-    scrape_fb_page(driver, 'All4PawsDogRescue')
-    scrape_fb_page(driver, 'SecondChanceAnimalRescueInc')
-    scrape_fb_page(driver, 'PuppyTalesRescue')
-    scrape_fb_page(driver, 'rescuedwithlove')
-    scrape_fb_page(driver, 'FFARLatrobe')
-    scrape_fb_page(driver, 'FFARau')
-    scrape_fb_page(driver, 'LostDogsHome')
-    scrape_fb_page(driver, 'PetRescueAU')
-    scrape_fb_page(driver, 'RSPCA.Victoria')
-    scrape_fb_page(driver, 'petshavenfoundation')
-    scrape_fb_page(driver, 'Australiank9rescuevic')
-    scrape_fb_page(driver, 'TheAnimalRehomingService')
-    scrape_fb_page(driver, 'melbourneanimalrescue')
-    scrape_fb_page(driver, 'newbeginnings.animalrescueinc')
-    scrape_fb_page(driver, 'Australiank9rescuevic')
-    scrape_fb_page(driver, 'Krazy-Kat-Rescue-974224009276491')
-
-    driver.quit()
+
+def create_driver_pool(headless=False):
+    # One browser for each of the browser lanes below
+    return driver_pool.DriverPool(lambda: create_driver(headless), size=2)
+
+
+HTTP_SITES = {
+    'dogshome': scrape_dogshome,
+    'petrescue': scrape_petrescue,
+}
+SHELTER_SITES = {
+    'adoptapet': scrape_adoptapet,
+    'saveadog': scrape_saveadog,
+    'rspca': scrape_rspca,
+    'petbarn': scrape_petbarn,
+}
+
+
+def _fb_sources():
+    """Source name -> url of each Facebook group and page"""
+    return {**{f'FB group {group_id}': f'https://touch.facebook.com/groups/{group_id}' for group_id in FB_GROUPS},
+            **{f'FB page {page_name}': f'https://touch.facebook.com/{page_name}/posts' for page_name in FB_PAGES}}
+
+
+def source_names():
+    """Names of every source, as reported by scrape and accepted in its `sources`"""
+    return list(HTTP_SITES) + list(SHELTER_SITES) + list(_fb_sources())
+
+
+def _run_browser_source(run_source, driver, name, func):
+    def run():
+        if LEAN_BROWSER:
+            lean_browser.block_for(driver, name)
+        if USE_NETWORK_CAPTURE:
+            # Every pooled browser logs network events, but only a couple of sources read them - drop the rest
+            # rather than let them pile up in chromedriver for the life of the browser
+            network_capture.drain(driver)
+        try:
+            return func()
+        finally:
+            if USE_NETWORK_CAPTURE:
+                try:
+                    network_capture.drain(driver)
+                except selenium.common.exceptions.WebDriverException:
+                    # Don't hide whatever went wrong with the browser during the source
+                    pass
+    run_source(name, run)
+
+
+def _http_lane(run_source, names, full_sweeps):
+    for name in names:
+        run_source(name, lambda: HTTP_SITES[name](full_sweeps[name]))
+
+
+def _shelter_sites_lane(run_source, names, full_sweeps, pool):
+    with pool.borrow(timeout=BORROW_TIMEOUT_SECONDS) as driver:
+        for name in names:
+            _run_browser_source(run_source, driver, name, lambda: SHELTER_SITES[name](driver, full_sweeps[name]))
+
+
+def _facebook_lane(run_source, names, full_sweeps, pool):
+    urls = _fb_sources()
+    with pool.borrow(timeout=BORROW_TIMEOUT_SECONDS) as driver:
+        if LEAN_BROWSER:
+            lean_browser.block_for(driver, 'FB')
+        fb_login(driver)
+        for name in names:
+            _run_browser_source(run_source, driver, name, lambda: scrape_fb_url(driver, urls[name], full_sweeps[name]))
+
+
+def scrape(headless=False, workers=SCRAPE_WORKERS, pool=None, full=None, sources=None):
+    """
+    Scrape every source, or just those named in `sources` (see source_names). Browsers are borrowed from `pool` if
+    given, otherwise started just for this scrape. `full` forces (or skips) a full sweep of every results page, which
+    otherwise happens on every FULL_SWEEP_EVERY-th scrape of each source.
+    """
+    sources = set(source_names() if sources is None else sources)
+    # Sources still being scraped by a lane an earlier scrape gave up waiting on are left to it, rather than scraped
+    # twice at once
+    still_running = sources & source_executor.busy_sources()
+    sources -= still_running
+    # With no credentials and no saved session (e.g. it has expired since the last check) Facebook can't be logged in
+    # to, so its sources fail without taking a browser while the rest are scraped as usual
+    no_fb_login = set()
+    if (EMAIL is None or PWD is None) and not os.path.exists(FB_COOKIES_PATH):
+        no_fb_login = sources & set(_fb_sources())
+        sources -= no_fb_login
+
+    # Decided per source up front and handed to each scraper, so a lane still running in the background from an
+    # earlier scrape doesn't see this one's choice
+    full_sweeps = {}
+    for name in sources:
+        full_sweeps[name] = scrape_counts.get(name, 0) % FULL_SWEEP_EVERY == 0 if full is None else full
+        scrape_counts[name] = scrape_counts.get(name, 0) + 1
+    if any(full_sweeps.values()):
+        print(f'Full sweep of every results page for {", ".join(sorted(n for n in sources if full_sweeps[n]))}')
+    own_pool = pool is None
+    if own_pool:
+        pool = create_driver_pool(headless)
+
+    # The plain HTTP sources each get their own lane, while the browser-driven ones share a browser per lane
+    lanes = [([name], lambda run_source, names: _http_lane(run_source, names, full_sweeps)) for name in HTTP_SITES] + [
+        (list(SHELTER_SITES), lambda run_source, names: _shelter_sites_lane(run_source, names, full_sweeps, pool)),
+        (list(_fb_sources()), lambda run_source, names: _facebook_lane(run_source, names, full_sweeps, pool)),
+    ]
+    lanes = [([name for name in names if name in sources], lane) for names, lane in lanes]
+    lanes = [(names, lane) for names, lane in lanes if names]
+    try:
+        report = source_executor.run_sources(lanes, workers=workers, timeout=SOURCE_TIMEOUT_SECONDS)
+        report += [source_executor.SourceResult(name, 0, 0, 'still running from an earlier scrape', 0, 0, deferred=True)
+                   for name in sorted(still_running)]
+        report += [source_executor.SourceResult(name, 0, 0, 'no Facebook session - restart with --fb-login', 0, 0)
+                   for name in sorted(no_fb_login)]
+    finally:
+        if own_pool:
+            pool.close()
+    source_executor.print_report(report)
+    return report
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+
+# waited is how many of the duration's seconds were spent blocked waiting on pages, and wait_timeouts how many of
+# those waits gave up without the page getting into the state waited for. deferred marks a source that wasn't run at
+# all through no fault of its own (error says why), e.g. its lane timed out on another source first.
+SourceResult = collections.namedtuple('SourceResult', ['name', 'new_dogs', 'duration', 'error', 'waited',
+                                                       'wait_timeouts', 'deferred'], defaults=[False])
+
+# Wait accounting for the source running on the current thread
+_waits = threading.local()
+# Sources belonging to lanes that are still running, including ones left running in the background after timing out
+_busy = set()
+_busy_lock = threading.Lock()
+
+
+def busy_sources():
+    """Sources an earlier run_sources call hasn't finished with, which shouldn't be started again yet"""
+    with _busy_lock:
+        return set(_busy)
+
+
+def record_wait(seconds, timed_out=False):
+    """Count time the current source spent blocked waiting, for the report"""
+    _waits.seconds = getattr(_waits, 'seconds', 0) + seconds
+    _waits.timeouts = getattr(_waits, 'timeouts', 0) + timed_out
+
+
+def run_sources(lanes, workers, timeout):
+    """
+    Run lanes of scrape sources concurrently on up to `workers` threads and return a SourceResult per source.
+
+    Each lane is a (source names, function) pair. The function is called with a `run_source(name, func)` callback and
+    the names, and calls run_source for each of its sources in turn. If the lane itself fails (e.g. can't start a
+    browser), each of its sources it hadn't run yet is reported as failing with the same error.
+    Sources within a lane run one after another (e.g. because they share a browser), while separate lanes run side by
+    side. func returns the number of new dogs it found. A source that takes longer than `timeout` seconds is reported
+    as timed out and its lane is no longer waited on - it can't be interrupted, so it carries on in the background,
+    skipping the rest of its sources (which are reported as abandoned). A lane stuck for `timeout` seconds before or
+    between sources (e.g. waiting for a browser) is given up on in the same way.
+    """
+    results = []
+    lock = threading.Lock()
+    # Lane index -> (name, start time) of the source it's currently running, or (None, time it last started or
+    # finished one) while it is between sources
+    running = {}
+    # Lane index -> names of the sources it has reported on
+    reported = {index: set() for index in range(len(lanes))}
+    abandoned = set()
+
+    def run_lane(index, names, lane):
+        def run_source(name, func):
+            with lock:
+                if index in abandoned:
+                    return
+            print(f'Scraping {name}...', flush=True)
+            start_time = time.time()
+            with lock:
+                running[index] = (name, start_time)
+            new_dogs, error = 0, None
+            _waits.seconds = _waits.timeouts = 0
+            try:
+                new_dogs = func() or 0
+            except Exception as e:
+                error = repr(e)
+            result = SourceResult(name, new_dogs, time.time() - start_time, error, _waits.seconds, _waits.timeouts)
+            with _busy_lock:
+                _busy.discard(name)
+            with lock:
+                if index in abandoned:
+                    # Already reported as timed out
+                    return
+                running[index] = (None, time.time())
+                results.append(result)
+                reported[index].add(name)
+            print(f'{name} failed: {error}' if error else f'{name} done - {new_dogs} dogs scraped.', flush=True)
+
+        with _busy_lock:
+            _busy.update(names)
+        with lock:
+            running[index] = (None, time.time())
+        try:
+            lane(run_source, names)
+        except Exception as e:
+            # Lane setup (e.g. starting a browser or logging in) failed, rather than any one source
+            print(f'Lane {index} failed: {e!r}', flush=True)
+            with lock:
+                if index not in abandoned:
+                    results.extend(SourceResult(name, 0, 0, repr(e), 0, 0)
+                                   for name in names if name not in reported[index])
+        finally:
+            with _busy_lock:
+                _busy.difference_update(names)
+            with lock:
+                running.pop(index, None)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(run_lane, index, names, lane): index for index, (names, lane) in enumerate(lanes)}
+    pending = set(futures)
+    while pending:
+        _, pending = concurrent.futures.wait(pending, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED)
+        with lock:
+            for future in list(pending):
+                index = futures[future]
+                if index in running and time.time() - running[index][1] > timeout:
+                    name, start_time = running.pop(index)
+                    abandoned.add(index)
+                    pending.remove(future)
+                    names = lanes[index][0]
+                    if name is not None:
+                        results.append(SourceResult(name, 0, time.time() - start_time, 'timed out', 0, 0))
+                    skipped = [other for other in names if other != name and other not in reported[index]]
+                    results.extend(SourceResult(other, 0, 0, 'abandoned - its lane timed out', 0, 0, deferred=True)
+                                   for other in skipped)
+                    # Those will never be started by this lane, so are free to be scraped again
+                    with _busy_lock:
+                        _busy.difference_update(skipped)
+                    print(f'Gave up waiting on {name or f"lane {index}"} after {timeout} seconds', flush=True)
+    executor.shutdown(wait=False)
+    with lock:
+        return list(results)
+
+
+def print_report(results):
+    print('\nSCRAPE REPORT')
+    for result in sorted(results, key=lambda r: r.duration, reverse=True):
+        if result.deferred:
+            status = f'DEFERRED ({result.error})'
+        else:
+            status = f'FAILED ({result.error})' if result.error else f'{result.new_dogs} new'
+        waits = f'{result.waited:6.1f}s waiting ({result.wait_timeouts} timeouts)' if result.waited else ''
+        print(f'{result.name:<45} {result.duration:7.1f}s  {status:<12} {waits}'.rstrip())
+    print(f'{sum(r.new_dogs for r in results)} new dogs from {len(results)} sources, '
+          f'{sum(1 for r in results if r.error and not r.deferred)} failed, '
+          f'{sum(1 for r in results if r.deferred)} deferred, '
+          f'{sum(r.waited for r in results):.1f}s spent waiting on pages.',
+          flush=True)
@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def empty_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'database.json'))
+    monkeypatch.setattr(database, 'JOURNAL_PATH', str(tmp_path / 'database.journal'))
+    monkeypatch.setattr(database, 'USE_JOURNAL', True)
+    # Every image is too small to keep, so nothing is downloaded or written outside tmp_path
+    monkeypatch.setattr(database, 'fetch_image', lambda img_url: (None, None))
+    database.load_db()
+    yield
+    database.load_db()
+
+
+def restart():
+    """Load the database from disk as a freshly started process would"""
+    database.dog_db = {}
+    database.load_db()
+
+
+def test_replays_journal():
+    assert database.add('u1', 'https://example.com/1.jpg')
+    database.set_notified('u1')
+    restart()
+    assert set(database.get_records()) == {'u1'}
+    assert database.get_records()['u1']['notified']
+    assert database.already_scraped('other', 'https://example.com/1.jpg')
+
+
+def test_replays_journal_over_snapshot():
+    database.add('u1', 'https://example.com/1.jpg')
+    database.save_db()
+    database.add('u2', 'https://example.com/2.jpg')
+    restart()
+    assert set(database.get_records()) == {'u1', 'u2'}
+
+
+def test_writes_after_a_torn_line_survive_the_next_restart():
+    database.add('u1', 'https://example.com/1.jpg')
+    with open(database.JOURNAL_PATH, 'a') as f:
+        f.write('[["u-torn",{"img":""')
+    restart()
+    assert set(database.get_records()) == {'u1'}
+    database.add('u2', 'https://example.com/2.jpg')
+    restart()
+    assert set(database.get_records()) == {'u1', 'u2'}
+
+
+def test_reload_without_snapshot_drops_records_not_on_disk():
+    database.add('u1', 'https://example.com/1.jpg')
+    database.dog_db['u-memory-only'] = database.dog_db['u1'].copy()
+    database.reload_database()
+    assert set(database.get_records()) == {'u1'}
+
+
+def test_transaction_commits_as_one_journal_line():
+    with database.transaction():
+        database.add('u1', 'https://example.com/1.jpg')
+        database.add('u2', 'https://example.com/2.jpg')
+    with open(database.JOURNAL_PATH) as f:
+        assert len(f.readlines()) == 1
+    restart()
+    assert set(database.get_records()) == {'u1', 'u2'}
+
+
+def test_transaction_rolls_back_on_error():
+    database.add('u1', 'https://example.com/1.jpg')
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.set_desired('u1', True, ['kelpie'])
+            database.add('u2', 'https://example.com/2.jpg')
+            raise RuntimeError
+    assert set(database.get_records()) == {'u1'}
+    assert database.get_records()['u1']['desired'] is False
+    assert not database.already_scraped('u2', 'https://example.com/2.jpg')
+    assert not database.get_unnotified()
+    restart()
+    assert set(database.get_records()) == {'u1'}
+    assert database.get_records()['u1']['desired'] is False
@@ -0,0 +1,87 @@
+import os
+import random
+import sys
+
+import pytest
+from bs4 import BeautifulSoup
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_listings  # noqa: E402
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURES = {
+    'dogshome_results.html': 'https://dogshome.com/dog-adoption/adopt-a-dog/?resulttype=1',
+    'petrescue_results.html': 'https://www.petrescue.com.au/listings/search/dogs?page=1&per_page=500',
+}
+
+
+def beautifulsoup_linked_jpgs(url, html):
+    """The BeautifulSoup tree walk scrape_generic used before html_listings, kept as the reference"""
+    listings = []
+    soup = BeautifulSoup(html, 'html.parser')
+    for img in soup.find_all('img'):
+        if 'src' in img.attrs:
+            for key in ['src', 'data-src']:
+                if key not in img.attrs:
+                    continue
+                src = img.attrs[key]
+                if not src.startswith('http'):
+                    parsed_url = urlparse(url)
+                    src = f'{parsed_url.scheme}://{parsed_url.netloc}{src}'
+                filename = os.path.basename(src)
+                if '?' in filename:
+                    filename = filename[:filename.index('?')]
+                if filename.lower().endswith('jpg') or filename.lower().endswith('jpeg'):
+                    parent = img.parent
+                    while parent and parent.name != 'a':
+                        parent = parent.parent
+                    if parent:
+                        listings.append((parent.attrs['href'], src))
+    return listings
+
+
+@pytest.mark.parametrize('fixture', sorted(FIXTURES))
+def test_matches_beautifulsoup_on_saved_pages(fixture):
+    with open(os.path.join(FIXTURES_DIR, fixture)) as f:
+        html = f.read()
+    expected = beautifulsoup_linked_jpgs(FIXTURES[fixture], html)
+    assert expected
+    assert html_listings.linked_jpgs(FIXTURES[fixture], html) == expected
+
+
+def _random_page(rng, length):
+    # Every <a> gets an href, since the old extractor raised KeyError on a jpg inside one without
+    tags = ['div', 'span', 'p', 'li', 'ul', 'section']
+    parts = []
+    for i in range(length):
+        r = rng.random()
+        if r < 0.25:
+            parts.append(f'<a href="/listing/{i}?a=1&amp;b=2">')
+        elif r < 0.4:
+            parts.append('</a>')
+        elif r < 0.6:
+            parts.append(f'<{rng.choice(tags)} class="card">')
+        elif r < 0.75:
+            parts.append(f'</{rng.choice(tags)}>')
+        elif r < 0.85:
+            src = rng.choice([f'/img/{i}.jpg', f'https://cdn.example.com/{i}.JPEG?w=300', '/img/icon.png'])
+            data_src = f' data-src="/img/{i}_large.jpg"' if rng.random() < 0.3 else ''
+            parts.append(f'<img src="{src}"{data_src}' + (' />' if rng.random() < 0.5 else '>'))
+        elif r < 0.9:
+            parts.append('<img data-src="/img/lazy.jpg">')
+        elif r < 0.95:
+            parts.append('<br><script>var link = "<a href=x>";</script>')
+        else:
+            parts.append('text &amp; more')
+    return ''.join(parts)
+
+
+def test_matches_beautifulsoup_on_unbalanced_markup():
+    rng = random.Random(0)
+    for _ in range(200):
+        html = _random_page(rng, rng.randint(1, 200))
+        assert html_listings.linked_jpgs('https://example.com/dogs', html) == \
+            beautifulsoup_linked_jpgs('https://example.com/dogs', html)
@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import network_capture  # noqa: E402
+
+
+ADOPTAPET_API = 'https://www.adoptapet.com.au/api/search?species=dog&page=1'
+PETBARN_API = 'https://www.petbarn.com.au/petspot/api/candidates?page=1'
+
+
+def test_finds_listings_nested_in_results():
+    payload = {
+        'meta': {'total': 2, 'page': 1, 'url': '/api/search?page=2'},
+        'results': [
+            {'id': 1, 'name': 'Biscuit', 'detailUrl': '/pet/1-biscuit',
+             'images': [{'thumbnail': None, 'large': 'https://cdn.adoptapet.com.au/1/large.jpg'}]},
+            {'id': 2, 'name': 'Rex', 'detail_url': 'https://www.adoptapet.com.au/pet/2-rex',
+             'primary-photo': {'src': '/media/2.jpg'}},
+        ],
+    }
+    assert network_capture.find_listings(payload, ADOPTAPET_API) == [
+        ('https://www.adoptapet.com.au/pet/1-biscuit', 'https://cdn.adoptapet.com.au/1/large.jpg'),
+        ('https://www.adoptapet.com.au/pet/2-rex', 'https://www.adoptapet.com.au/media/2.jpg'),
+    ]
+
+
+def test_finds_listings_in_a_top_level_list():
+    payload = [
+        {'name': 'Milo', 'url': 'https://www.petbarn.com.au/petspot/adopt/milo-123', 'image': '/media/milo.jpg'},
+        {'name': 'Luna', 'enquiry_url': '/petspot/adopt/luna-124', 'photos': ['', '/media/luna.jpg']},
+    ]
+    assert network_capture.find_listings(payload, PETBARN_API) == [
+        ('https://www.petbarn.com.au/petspot/adopt/milo-123', 'https://www.petbarn.com.au/media/milo.jpg'),
+        ('https://www.petbarn.com.au/petspot/adopt/luna-124', 'https://www.petbarn.com.au/media/luna.jpg'),
+    ]
+
+
+def test_ignores_objects_without_both_a_link_and_an_image():
+    payload = {
+        'config': {'url': 'https://www.adoptapet.com.au/', 'logo': '/logo.png'},
+        'banner': {'image': '/banner.jpg', 'title': 'Adopt'},
+        'results': [{'name': 'No photo', 'url': '/pet/3'}, {'name': 'Not a url', 'url': 'pending', 'image': '/4.jpg'}],
+    }
+    assert network_capture.find_listings(payload, ADOPTAPET_API) == []
+
+
+def test_first_listing_found_in_an_object_wins_over_nested_ones():
+    payload = {'url': '/pet/5', 'image': '/5.jpg', 'related': [{'url': '/pet/6', 'image': '/6.jpg'}]}
+    assert network_capture.find_listings(payload, ADOPTAPET_API) == [
+        ('https://www.adoptapet.com.au/pet/5', 'https://www.adoptapet.com.au/5.jpg'),
+    ]
+
+
+class FakeDriver:
+    """Replays a performance log of JSON responses, as Chrome would report them"""
+
+    def __init__(self, responses):
+        self.bodies = {}
+        self.log = []
+        for request_id, (url, mime_type, body) in enumerate(responses):
+            self.bodies[str(request_id)] = body
+            message = {'method': 'Network.responseReceived',
+                       'params': {'requestId': str(request_id), 'response': {'url': url, 'mimeType': mime_type}}}
+            self.log.append({'message': json.dumps({'message': message})})
+
+    def get_log(self, log_type):
+        log, self.log = self.log, []
+        return log
+
+    def execute_cdp_cmd(self, cmd, args):
+        return {'body': self.bodies[args['requestId']], 'base64Encoded': False}
+
+
+def test_listings_only_read_matching_urls():
+    listing = json.dumps([{'url': '/pet/7', 'image': '/7.jpg'}, {'url': '/pet/7', 'image': '/7b.jpg'}])
+    driver = FakeDriver([
+        (ADOPTAPET_API, 'application/json', listing),
+        ('https://www.adoptapet.com.au/api/featured', 'application/json',
+         json.dumps({'url': '/pet/8', 'image': '/8.jpg'})),
+        ('https://www.adoptapet.com.au/api/search?page=2', 'text/html', '<html></html>'),
+    ])
+    assert network_capture.listings(driver, 'adoptapet.com.au/api/search') == [
+        ('https://www.adoptapet.com.au/pet/7', 'https://www.adoptapet.com.au/7.jpg'),
+    ]
+    # Read once only
+    assert network_capture.listings(driver, 'adoptapet.com.au/api/search') == []
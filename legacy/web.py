@@ -16,7 +16,7 @@ def capitalise(string):
 
 def generate_thumbnail(href, info):
     colour = '#cccccc'
-    if info['desired'] == False:
+    if info['desired'] == False and not info.get('duplicate_of'):
         colour = '#fc9d9d'
     elif info['desired']:
         colour = '#abfc9d'
@@ -24,7 +24,8 @@ def generate_thumbnail(href, info):
     return html.Div([
         html.A([
             html.Img(
-                src=app.get_asset_url(info['img']),
+                # Images too small to be dogs aren't stored locally
+                src=app.get_asset_url(info['img']) if info['img'] else info['img_url'],
                 style={
                     'width': '250px',
                     'height': '250px',
@@ -41,10 +42,12 @@ def generate_thumbnail(href, info):
             html.Div([
                 html.Div(capitalise(b.replace('_', ' ')).split(',')[0]) for b in info['predicted_classes']
             ]) if info['predicted_classes'] else html.Div([
+                html.A('Repost of an earlier listing', href=info['duplicate_of'], target='_blank')
+                if info.get('duplicate_of') else
                 'No predictions yet' if info['desired'] is None else 'Not a dog!'
             ]),
 
-            html.Div(f'Scraped: {info["scrape_datetime"][:info["scrape_datetime"].rindex(".")]}',
+            html.Div(f'Scraped: {info["scrape_datetime"][:19]}',
                      style={'margin': '10px', 'font-style': 'italic'})
         ],
         style={